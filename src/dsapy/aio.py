@@ -0,0 +1,50 @@
+#!/usr/bin/python
+# -*- mode: python; coding: utf-8 -*-
+
+"""Event loop selection for async mains.
+
+`app.start` runs coroutine mains and async `onmain` handlers on a single
+event loop.  Import this module to get the "Asyncio" flags that choose the
+loop implementation; `uvloop` is offered if it is installed.  The default
+comes from `DSAPY_EVENT_LOOP` in the environment.
+"""
+
+import asyncio
+import importlib.util
+import os
+
+from dsapy import app
+from dsapy import flag
+
+
+class Error(app.Error):
+    """Base class for errors in the module."""
+
+
+def _loops():
+    loops = ['asyncio']
+    if importlib.util.find_spec('uvloop') is not None:
+        loops.append('uvloop')
+    return loops
+
+
+@flag.argroup('Asyncio')
+def _flags(argroup):
+    loops = _loops()
+    default = os.environ.get('DSAPY_EVENT_LOOP', 'asyncio')
+    argroup.add_argument(
+        '--event-loop',
+        choices=loops,
+        default=default if default in loops else 'asyncio',
+        help='Event loop implementation',
+    )
+
+
+@app.init
+def _init(**kwargs):
+    flags = kwargs['flags']
+    if flags.event_loop == 'uvloop':
+        import uvloop  # type: ignore[import-not-found]
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    elif flags.event_loop != 'asyncio':
+        raise Error('Unknown event loop: {!r}'.format(flags.event_loop))
@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+# -*- mode: python; coding: utf-8 -*-
+
+"""Asyncio versions of `dsapy.algs.bdfs` traversals.
+
+`exits` is a coroutine function: `await exits(node)` returns an iterable of
+children.  Up to `concurrency` calls are kept in flight, so a crawl over a
+slow backend takes roughly the sum of round-trips divided by
+`concurrency` instead of the sum itself.  Each node is yielded once.
+"""
+
+import asyncio
+import collections
+
+
+async def bfs(start, exits, concurrency=8, ordered=True):
+    """Breadth-first traversal as an async generator.
+
+    With `ordered`, nodes come out in the same order as `bdfs.bfs` yields
+    them; otherwise children are yielded as soon as any expansion
+    completes, which keeps all slots busy when latencies vary.
+
+    >>> async def exits(node):
+    ...     await asyncio.sleep(0.01 * (4 - node) if node < 4 else 0)
+    ...     return {1: [2, 3], 2: [4], 3: [5]}.get(node, [])
+    >>> async def collect(**kwargs):
+    ...     return [n async for n in bfs([1], exits, **kwargs)]
+    >>> asyncio.run(collect())
+    [1, 2, 3, 4, 5]
+    >>> asyncio.run(collect(ordered=False))
+    [1, 2, 3, 5, 4]
+    """
+    visited = set()
+    pending = collections.deque()
+    for node in start:
+        if node in visited:
+            continue
+        visited.add(node)
+        pending.append(node)
+        yield node
+
+    in_flight = collections.deque() if ordered else set()
+    add = in_flight.append if ordered else in_flight.add
+    try:
+        while True:
+            while pending and len(in_flight) < concurrency:
+                add(asyncio.ensure_future(exits(pending.popleft())))
+            if not in_flight:
+                break
+
+            if ordered:
+                done = [in_flight.popleft()]
+                await done[0]
+            else:
+                done, _ = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                in_flight.difference_update(done)
+
+            for task in done:
+                for c in task.result():
+                    if c in visited:
+                        continue
+                    visited.add(c)
+                    pending.append(c)
+                    yield c
+    finally:
+        for task in in_flight:
+            task.cancel()
+
+
+async def dfs(start, exits, concurrency=8):
+    """Depth-first traversal in preorder as an async generator.
+
+    The order is the same as `bdfs.dfs`.  While a node is being visited,
+    exits of up to `concurrency` of its unvisited children are fetched
+    ahead, since they are visited next unless reached from elsewhere first.
+
+    >>> async def exits(node):
+    ...     await asyncio.sleep(0.001)
+    ...     return {1: [2, 3], 2: [4], 3: [4], 4: [1], 5: [3]}.get(node, [])
+    >>> async def collect():
+    ...     return [n async for n in dfs([1, 5], exits)]
+    >>> asyncio.run(collect())
+    [1, 3, 4, 2, 5]
+    """
+    visited = set()
+    fetched = {}
+    limit = asyncio.Semaphore(concurrency)
+
+    async def limited(node):
+        async with limit:
+            return await exits(node)
+
+    def prefetch(node):
+        if node not in fetched:
+            fetched[node] = asyncio.ensure_future(limited(node))
+
+    async def children(node):
+        # Last exit first, as in `bdfs.dfs`.
+        prefetch(node)
+        result = list(await fetched.pop(node))
+        result.reverse()
+        n = 0
+        for c in result:
+            if n >= concurrency:
+                break
+            if c not in visited:
+                prefetch(c)
+                n += 1
+        return iter(result)
+
+    try:
+        for root in start:
+            if root in visited:
+                continue
+            visited.add(root)
+            yield root
+
+            stack = [await children(root)]
+            while stack:
+                for e in stack[-1]:
+                    if e not in visited:
+                        break
+                else:
+                    stack.pop()
+                    continue
+
+                visited.add(e)
+                yield e
+                stack.append(await children(e))
+    finally:
+        for task in fetched.values():
+            task.cancel()
+
+
+if __name__ == '__main__':
+    # Run the doctest tests.
+    import sys
+    import doctest
+    doctest.testmod(sys.modules['__main__'])
@@ -1,33 +1,130 @@
 #!/usr/bin/python3
 # -*- mode: python; coding: utf-8 -*-
 
+"""Breadth-first and depth-first traversals.
+
+Both generators yield every reachable node exactly once.  Optional `depth`,
+`parent` and `order` dicts are filled in as nodes are discovered, and are
+up to date for every yielded node, so a shortest-path (BFS) or DFS tree
+comes out of the same pass:
+
+    - depth[node]: number of edges from the closest start node (BFS) or
+      depth in the DFS tree;
+    - parent[node]: the node it was discovered from, None for start nodes;
+    - order[node]: discovery index, equal to the position in the output.
+"""
+
 import collections
 
 
-def bfs(start, exits):
+def bfs(start, exits, depth=None, parent=None, order=None):
+    """Breadth-first traversal.
+
+    Nodes are marked when queued, so converging edges don't queue a node
+    twice.
+
+    >>> exits = {1: [2, 3], 2: [4], 3: [4], 4: [1]}.get
+    >>> parent, depth = {}, {}
+    >>> list(bfs([1], exits, depth=depth, parent=parent))
+    [1, 2, 3, 4]
+    >>> parent
+    {1: None, 2: 1, 3: 1, 4: 2}
+    >>> depth
+    {1: 0, 2: 1, 3: 1, 4: 2}
+
+    The dicts are filled in before a node is yielded:
+
+    >>> order = {}
+    >>> [(n, order[n]) for n in bfs([1], exits, order=order)]
+    [(1, 0), (2, 1), (3, 2), (4, 3)]
+    """
     visited = set()
-    q = collections.deque(start)
+    q = collections.deque()
+    for node in start:
+        if node in visited:
+            continue
+        visited.add(node)
+        q.append(node)
+        if depth is not None:
+            depth[node] = 0
+        if parent is not None:
+            parent[node] = None
+
+    index = 0
     while q:
         node = q.popleft()
+        if order is not None:
+            order[node] = index
+            index += 1
         yield node
-        visited.add(node)
         for e in exits(node):
             if e in visited:
                 continue
+            visited.add(e)
             q.append(e)
+            if depth is not None:
+                depth[e] = depth[node] + 1
+            if parent is not None:
+                parent[e] = node
 
 
-def dfs(start, exits):
+def dfs(start, exits, depth=None, parent=None, order=None):
+    """Depth-first traversal in preorder.
+
+    Start nodes are visited in the given order, but exits of a node are
+    visited last first, as if they were pushed on a stack of nodes.  Keeps
+    a stack of the not yet visited exits of the nodes on the current path
+    rather than of all pushed nodes.
+
+    >>> exits = {1: [2, 3], 2: [4], 3: [4], 4: [1], 5: [3]}.get
+    >>> parent, order = {}, {}
+    >>> list(dfs([1, 5], exits, parent=parent, order=order))
+    [1, 3, 4, 2, 5]
+    >>> parent
+    {1: None, 3: 1, 4: 3, 2: 1, 5: None}
+    >>> order
+    {1: 0, 3: 1, 4: 2, 2: 3, 5: 4}
+    >>> depth = {}
+    >>> [(n, depth[n]) for n in dfs([1, 5], exits, depth=depth)]
+    [(1, 0), (3, 1), (4, 2), (2, 1), (5, 0)]
+    """
     visited = set()
-    q = list(reversed(start))
-    while q:
-        node = q.pop()
-        yield node
-        visited.add(node)
-        for e in exits(node):
-            if e in visited:
+    index = 0
+    for root in start:
+        if root in visited:
+            continue
+        visited.add(root)
+        if depth is not None:
+            depth[root] = 0
+        if parent is not None:
+            parent[root] = None
+        if order is not None:
+            order[root] = index
+            index += 1
+        yield root
+
+        nodes = [root]
+        stack = [reversed(list(exits(root)))]
+        while stack:
+            for e in stack[-1]:
+                if e not in visited:
+                    break
+            else:
+                nodes.pop()
+                stack.pop()
                 continue
-            q.append(e)
+
+            visited.add(e)
+            if depth is not None:
+                depth[e] = len(nodes)
+            if parent is not None:
+                parent[e] = nodes[-1]
+            if order is not None:
+                order[e] = index
+                index += 1
+            yield e
+            nodes.append(e)
+            stack.append(reversed(list(exits(e))))
 
 
 if __name__ == '__main__':
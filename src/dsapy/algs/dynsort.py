@@ -0,0 +1,184 @@
+#!/usr/bin/python3
+# -*- mode: python; coding: utf-8 -*-
+
+"""Incremental topological order maintenance.
+
+Implements the Pearce-Kelly online algorithm: inserting an edge that
+agrees with the current order costs O(1); otherwise only the nodes between
+the two endpoints in the order are searched and reshuffled.
+"""
+
+from dsapy.algs.topsort import CycleError, topsort
+
+
+class EdgeCycleError(CycleError):
+    """Edge rejected by `DynamicDAG.add_edge` because it closes a cycle.
+
+    `edge` is the rejected (parent, child) pair and `cycle` the cycle path
+    starting and ending at parent.  Args have the `CycleError` shape, but
+    without the order, which would be copied for every rejected edge: (None,
+    [nodes of the cycle], [cycle]).  The graph is unchanged, its `order()`
+    is still valid.
+    """
+
+    def __init__(self, edge, cycle):
+        super().__init__(None, [cycle[:-1]], [cycle])
+        self.edge = edge
+        self.cycle = cycle
+
+    def __str__(self):
+        return 'edge {!r} closes cycle {!r}'.format(self.edge, self.cycle)
+
+
+class DynamicDAG(object):
+    """Directed acyclic graph that keeps a valid topological order.
+
+    >>> g = DynamicDAG([(1, 2), (2, 3)])
+    >>> g.order()
+    [1, 2, 3]
+    >>> g.add_edge(4, 1)
+    >>> g.order()
+    [4, 1, 2, 3]
+    >>> try:
+    ...     g.add_edge(3, 4)
+    ... except EdgeCycleError as e:
+    ...     print(e.edge, e.cycle, e.args[1:])
+    (3, 4) [3, 4, 1, 2, 3] ([[3, 4, 1, 2]], [[3, 4, 1, 2, 3]])
+    >>> try:
+    ...     g.add_edge(5, 5)
+    ... except EdgeCycleError as e:
+    ...     print(e)
+    edge (5, 5) closes cycle [5, 5]
+    >>> 5 in g
+    False
+    >>> g.remove_edge(1, 2)
+    >>> g.add_edge(3, 4)
+    >>> g.order()
+    [2, 3, 4, 1]
+    """
+
+    def __init__(self, edges=(), nodes=()):
+        edges = list(edges)
+        self._out = {}
+        self._in = {}
+        self._ord = {}
+        self._pos = []
+        for n in nodes:
+            self.add_node(n)
+        for n in topsort(edges):
+            self.add_node(n)
+        for parent, child in edges:
+            self._out[parent].add(child)
+            self._in[child].add(parent)
+
+    def __len__(self):
+        return len(self._pos)
+
+    def __contains__(self, node):
+        return node in self._ord
+
+    def add_node(self, node):
+        """Add a node at the end of the order; no-op if it exists."""
+        if node in self._ord:
+            return
+        self._ord[node] = len(self._pos)
+        self._pos.append(node)
+        self._out[node] = set()
+        self._in[node] = set()
+
+    def add_edge(self, parent, child):
+        """Add an edge; raise `EdgeCycleError` (and keep the graph) if it closes a cycle.
+
+        A cycle is only possible between nodes that are already in the
+        graph, so new endpoints are added after the self-loop check.
+        """
+        if parent == child:
+            raise EdgeCycleError((parent, child), [parent, child])
+        self.add_node(parent)
+        self.add_node(child)
+        if child in self._out[parent]:
+            return
+
+        lb = self._ord[child]
+        ub = self._ord[parent]
+        if lb < ub:
+            forward = self._forward(child, parent, ub)
+            backward = self._backward(parent, lb)
+            self._reorder(forward, backward)
+
+        self._out[parent].add(child)
+        self._in[child].add(parent)
+
+    def remove_edge(self, parent, child):
+        """Remove an edge; the current order stays valid."""
+        self._out[parent].remove(child)
+        self._in[child].remove(parent)
+
+    def order(self):
+        """Return the nodes in topological order."""
+        return list(self._pos)
+
+    def index(self, node):
+        """Position of the node in the current order."""
+        return self._ord[node]
+
+    def exits(self, node):
+        return self._out[node]
+
+    def entries(self, node):
+        return self._in[node]
+
+    def _forward(self, start, target, ub):
+        # Nodes reachable from `start` that are ordered before `ub`.
+        order = self._ord
+        out = self._out
+        parents = {start: None}
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for c in out[node]:
+                if c == target:
+                    path = [c]
+                    while node is not None:
+                        path.append(node)
+                        node = parents[node]
+                    path.append(target)
+                    path.reverse()
+                    raise EdgeCycleError((target, start), path)
+                if c not in parents and order[c] < ub:
+                    parents[c] = node
+                    stack.append(c)
+        return list(parents)
+
+    def _backward(self, start, lb):
+        # Nodes reaching `start` that are ordered after `lb`.
+        order = self._ord
+        entries = self._in
+        seen = {start}
+        stack = [start]
+        while stack:
+            node = stack.pop()
+            for p in entries[node]:
+                if p not in seen and order[p] > lb:
+                    seen.add(p)
+                    stack.append(p)
+        return list(seen)
+
+    def _reorder(self, forward, backward):
+        # Backward set goes first, forward set after it, each keeping its
+        # relative order, in the union of slots they occupied.
+        order = self._ord
+        forward.sort(key=order.__getitem__)
+        backward.sort(key=order.__getitem__)
+        nodes = backward + forward
+        slots = sorted(order[n] for n in nodes)
+        for n, i in zip(nodes, slots):
+            order[n] = i
+            self._pos[i] = n
+
+
+if __name__ == '__main__':
+    # Run the doctest tests.
+    import sys
+    import doctest
+    doctest.testmod(sys.modules['__main__'])
@@ -1,2 +1,415 @@
 #!/usr/bin/python3
 # -*- mode: python; coding: utf-8 -*-
+
+"""Compact directed graph with integer node IDs.
+
+Nodes are interned into dense IDs `0..n-1` and adjacency is kept in
+compressed sparse row (CSR) form: exits of node `i` are
+`targets[offsets[i]:offsets[i + 1]]`.  Both tables are `array.array`s, so a
+graph with millions of edges costs a few bytes per edge instead of a Python
+object per edge.
+
+Traversals in this module work on IDs directly and don't call back into
+Python per node.  Use `Graph.ids` and `Graph.names` to translate.
+
+Weighted shortest path searches (`dijkstra`, `astar`, `bidirectional`) take
+an `exits(node)` callback returning (child, weight) pairs, like
+`dsapy.algs.bdfs`; for a `Graph` with weights pass `graph.weighted_exits`.
+All of them take arguments in the same order: an iterable of start nodes,
+`exits`, then `target`.  They keep only parent pointers, use `path` to
+reconstruct a route.
+"""
+
+from dsapy.algs.topsort import CycleError
+from dsapy.algs import scc
+
+import array
+import heapq
+import itertools
+import math
+
+# Typecodes for node IDs, edge offsets and edge weights.
+_ID = 'i'
+_OFFSET = 'q'
+_WEIGHT = 'd'
+
+
+class Graph(object):
+    """Directed graph in CSR form.
+
+    `nodes[i]` is the original object for ID `i`, `index` maps objects back
+    to IDs.  Build with `Graph.from_edges`.
+
+    >>> g = Graph.from_edges([('a', 'b'), ('a', 'c'), ('c', 'b')], nodes=['d'])
+    >>> len(g), g.n_edges
+    (4, 3)
+    >>> g.nodes
+    ['d', 'a', 'b', 'c']
+    >>> g.names(g.exits(g.index['a']))
+    ['b', 'c']
+    >>> g.names(g.transpose().exits(g.index['b']))
+    ['a', 'c']
+
+    Edges may carry weights, kept in the `weights` array parallel to
+    `targets`:
+
+    >>> g = Graph.from_edges([('a', 'b', 2.5), ('a', 'c', 1)], weighted=True)
+    >>> [(g.nodes[c], w) for c, w in g.weighted_exits(g.index['a'])]
+    [('b', 2.5), ('c', 1.0)]
+    """
+
+    def __init__(self, nodes, offsets, targets, index=None, weights=None):
+        self.nodes = nodes
+        self.index = index if index is not None else {n: i for i, n in enumerate(nodes)}
+        self.offsets = offsets
+        self.targets = targets
+        self.weights = weights
+
+    @classmethod
+    def from_edges(cls, edges, nodes=(), weighted=False):
+        """Build a graph from an iterable of (parent, child) pairs.
+
+        `nodes` may list extra nodes (e.g. isolated ones); they get the
+        lowest IDs in the given order.  Remaining IDs are assigned in order of
+        first appearance in `edges`.  Exits of each node keep edge order.
+
+        With `weighted`, edges are (parent, child, weight) triples.
+        """
+        if weighted:
+            weights = array.array(_WEIGHT)
+            pairs = []
+            for parent, child, weight in edges:
+                pairs.append((parent, child))
+                weights.append(weight)
+            edges = pairs
+        else:
+            weights = None
+
+        index = {}
+        names = []
+        for n in nodes:
+            if n not in index:
+                index[n] = len(names)
+                names.append(n)
+
+        sources = array.array(_ID)
+        dests = array.array(_ID)
+        for parent, child in edges:
+            p = index.get(parent)
+            if p is None:
+                p = index[parent] = len(names)
+                names.append(parent)
+            c = index.get(child)
+            if c is None:
+                c = index[child] = len(names)
+                names.append(child)
+            sources.append(p)
+            dests.append(c)
+
+        offsets, targets, weights = _csr(len(names), sources, dests, weights)
+        return cls(names, offsets, targets, index, weights)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def __repr__(self):
+        return '<Graph nodes={} edges={}>'.format(len(self.nodes), len(self.targets))
+
+    @property
+    def n_edges(self):
+        return len(self.targets)
+
+    def exits(self, node_id):
+        """Return an array of IDs of the children of `node_id`."""
+        return self.targets[self.offsets[node_id]:self.offsets[node_id + 1]]
+
+    def weighted_exits(self, node_id):
+        """Return (child_id, weight) pairs of `node_id`; the graph must be weighted."""
+        begin = self.offsets[node_id]
+        end = self.offsets[node_id + 1]
+        return zip(self.targets[begin:end], self.weights[begin:end])
+
+    def ids(self, nodes):
+        index = self.index
+        return [index[n] for n in nodes]
+
+    def names(self, ids):
+        nodes = self.nodes
+        return [nodes[i] for i in ids]
+
+    def edges(self):
+        """Iterate over (parent_id, child_id) pairs."""
+        offsets = self.offsets
+        targets = self.targets
+        for p in range(len(self.nodes)):
+            for i in range(offsets[p], offsets[p + 1]):
+                yield p, targets[i]
+
+    def transpose(self):
+        """Return the graph with all edges reversed; the node table is shared."""
+        n = len(self.nodes)
+        sources = array.array(_ID, bytes(array.array(_ID).itemsize * len(self.targets)))
+        offsets = self.offsets
+        for p in range(n):
+            for i in range(offsets[p], offsets[p + 1]):
+                sources[i] = p
+        r_offsets, r_targets, r_weights = _csr(n, self.targets, sources, self.weights)
+        return Graph(self.nodes, r_offsets, r_targets, self.index, r_weights)
+
+
+def _csr(n, sources, dests, weights=None):
+    """Counting-sort edges by source into (offsets, targets, weights) arrays."""
+    counts = array.array(_OFFSET, [0]) * (n + 1)
+    for s in sources:
+        counts[s + 1] += 1
+    offsets = array.array(_OFFSET, itertools.accumulate(counts))
+
+    targets = array.array(_ID, [0]) * len(dests)
+    pos = offsets[:-1]
+    if weights is None:
+        for s, d in zip(sources, dests):
+            targets[pos[s]] = d
+            pos[s] += 1
+        return offsets, targets, None
+
+    r_weights = array.array(_WEIGHT, [0.0]) * len(dests)
+    for s, d, w in zip(sources, dests, weights):
+        i = pos[s]
+        targets[i] = d
+        r_weights[i] = w
+        pos[s] = i + 1
+    return offsets, targets, r_weights
+
+
+def bfs(graph, start):
+    """Breadth-first traversal from node IDs `start`, yields node IDs.
+
+    >>> g = Graph.from_edges([(0, 1), (0, 2), (1, 3), (2, 3), (3, 0)])
+    >>> list(bfs(g, [0]))
+    [0, 1, 2, 3]
+    """
+    offsets = graph.offsets
+    targets = graph.targets
+    seen = bytearray(len(graph))
+    queue = []
+    for s in start:
+        if not seen[s]:
+            seen[s] = 1
+            queue.append(s)
+    for node in queue:
+        yield node
+        for c in targets[offsets[node]:offsets[node + 1]]:
+            if not seen[c]:
+                seen[c] = 1
+                queue.append(c)
+
+
+def dfs(graph, start):
+    """Depth-first traversal (preorder) from node IDs `start`, yields node IDs.
+
+    >>> g = Graph.from_edges([(0, 1), (0, 2), (1, 3), (2, 3), (3, 0), (4, 2)])
+    >>> list(dfs(g, [0, 4]))
+    [0, 1, 3, 2, 4]
+    """
+    offsets = graph.offsets
+    targets = graph.targets
+    seen = bytearray(len(graph))
+    for s in start:
+        if seen[s]:
+            continue
+        seen[s] = 1
+        yield s
+        nodes = [s]
+        positions = [offsets[s]]
+        while nodes:
+            node = nodes[-1]
+            p = positions[-1]
+            end = offsets[node + 1]
+            while p < end and seen[targets[p]]:
+                p += 1
+            if p == end:
+                nodes.pop()
+                positions.pop()
+                continue
+            c = targets[p]
+            positions[-1] = p + 1
+            seen[c] = 1
+            yield c
+            nodes.append(c)
+            positions.append(offsets[c])
+
+
+def topsort(graph):
+    """Topologically sort node IDs of the graph.
+
+    Same algorithm and order as `dsapy.algs.topsort.topsort`, but returns IDs.
+
+    >>> g = Graph.from_edges([(1,2), (3,4), (5,6), (1,3), (1,5), (1,6), (2,5)])
+    >>> g.names(topsort(g))
+    [1, 2, 3, 5, 4, 6]
+
+    >>> g = Graph.from_edges([(1,2), (2,3), (3,2), (2, 4)])
+    >>> topsort(g)
+    Traceback (most recent call last):
+    dsapy.algs.topsort.CycleError: ([0], [[1, 2]], [[1, 2, 1]])
+    """
+    n = len(graph)
+    offsets = graph.offsets
+    targets = graph.targets
+    n_parents = array.array(_ID, [0]) * n
+    for c in targets:
+        n_parents[c] += 1
+
+    results = [i for i in range(n) if not n_parents[i]]
+    for r in results:
+        for c in targets[offsets[r]:offsets[r + 1]]:
+            n_parents[c] -= 1
+            if not n_parents[c]:
+                results.append(c)
+
+    if len(results) < n:
+        exits = graph.exits
+        blocked = [i for i in range(n) if n_parents[i]]
+        comps = [c for c in scc.components(blocked, exits) if scc.is_cyclic(c, exits)]
+        comps.reverse()
+        raise CycleError(results, comps, [scc.find_cycle(c, exits) for c in comps])
+
+    return results
+
+
+def path(parent, target):
+    """Follow parent pointers from `target` back to a start node; return the route.
+
+    >>> path({'a': None, 'b': 'a', 'c': 'b'}, 'c')
+    ['a', 'b', 'c']
+    """
+    route = []
+    node = target
+    while node is not None:
+        route.append(node)
+        node = parent[node]
+    route.reverse()
+    return route
+
+
+def dijkstra(start, exits, target=None):
+    """Shortest distances from the start nodes; weights must be non-negative.
+
+    `exits(node)` returns (child, weight) pairs.  Return (dist, parent)
+    dicts for all settled nodes; parent of a start node is None.  If
+    `target` is given, stop as soon as it is settled.
+
+    >>> g = Graph.from_edges([('a', 'b', 4), ('a', 'c', 1), ('c', 'b', 2), ('b', 'd', 1)], weighted=True)
+    >>> dist, parent = dijkstra(g.ids(['a']), g.weighted_exits)
+    >>> g.names(path(parent, g.index['d'])), dist[g.index['d']]
+    (['a', 'c', 'b', 'd'], 4.0)
+    """
+    return astar(start, exits, target, None)
+
+
+def astar(start, exits, target, heuristic):
+    """A* search from the start nodes to `target`.
+
+    `heuristic(node)` estimates the remaining distance to `target`; it must
+    be consistent (never decrease by more than the edge weight along an
+    edge), so nodes are settled once.  None turns the search into Dijkstra.  Return
+    (dist, parent) as `dijkstra` does.
+
+    >>> coords = {'a': (0, 0), 'b': (1, 0), 'c': (0, 1), 'd': (1, 1)}
+    >>> edges = {'a': [('b', 1), ('c', 1)], 'b': [('d', 1)], 'c': [('d', 1.5)], 'd': []}
+    >>> h = lambda n: abs(coords[n][0] - 1) + abs(coords[n][1] - 1)
+    >>> dist, parent = astar(['a'], edges.get, 'd', h)
+    >>> path(parent, 'd'), dist['d']
+    (['a', 'b', 'd'], 2)
+    """
+    dist = {}
+    parent = {}
+    best = {}
+    counter = itertools.count()
+    heap = []
+    for s in start:
+        best[s] = 0
+        parent[s] = None
+        heap.append((heuristic(s) if heuristic else 0, next(counter), 0, s))
+    heapq.heapify(heap)
+
+    while heap:
+        _, _, d, node = heapq.heappop(heap)
+        if node in dist:
+            continue
+        dist[node] = d
+        if node == target:
+            break
+        for c, w in exits(node):
+            if c in dist:
+                continue
+            nd = d + w
+            if c not in best or nd < best[c]:
+                best[c] = nd
+                parent[c] = node
+                heapq.heappush(heap, (nd + heuristic(c) if heuristic else nd, next(counter), nd, c))
+
+    # Drop tentative parents of unsettled nodes.
+    return dist, {n: parent[n] for n in dist}
+
+
+def bidirectional(start, exits, target, rexits):
+    """Bidirectional Dijkstra from the start nodes to `target`.
+
+    Arguments are as in `astar`; `rexits(node)` returns (parent, weight)
+    pairs of incoming edges, e.g. `graph.transpose().weighted_exits`.
+    Return (distance, route), or None if `target` is unreachable.
+
+    >>> g = Graph.from_edges([(0, 1, 1), (1, 2, 1), (0, 2, 3), (2, 3, 1), (3, 4, 5), (2, 4, 7)], weighted=True)
+    >>> bidirectional([0], g.weighted_exits, 4, g.transpose().weighted_exits)
+    (8.0, [0, 1, 2, 3, 4])
+    >>> bidirectional([0, 3], g.weighted_exits, 4, g.transpose().weighted_exits)
+    (5.0, [3, 4])
+    """
+    start = list(start)
+    if target in start:
+        return 0, [target]
+
+    counter = itertools.count()
+    dist = ({s: 0 for s in start}, {target: 0})
+    parent = ({s: None for s in start}, {target: None})
+    settled = (set(), set())
+    heaps = ([(0, next(counter), s) for s in start], [(0, next(counter), target)])
+    steps = (exits, rexits)
+    best = math.inf
+    meet = None
+
+    while heaps[0] and heaps[1]:
+        if heaps[0][0][0] + heaps[1][0][0] >= best:
+            break
+        side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+        d, _, node = heapq.heappop(heaps[side])
+        if node in settled[side]:
+            continue
+        settled[side].add(node)
+        other = 1 - side
+        for c, w in steps[side](node):
+            nd = d + w
+            if c not in dist[side] or nd < dist[side][c]:
+                dist[side][c] = nd
+                parent[side][c] = node
+                heapq.heappush(heaps[side], (nd, next(counter), c))
+            if c in dist[other] and dist[side][c] + dist[other][c] < best:
+                best = dist[side][c] + dist[other][c]
+                meet = c
+
+    if meet is None:
+        return None
+    route = path(parent[0], meet)
+    node = parent[1][meet]
+    while node is not None:
+        route.append(node)
+        node = parent[1][node]
+    return best, route
+
+
+if __name__ == '__main__':
+    # Run the doctest tests.
+    import sys
+    import doctest
+    doctest.testmod(sys.modules['__main__'])
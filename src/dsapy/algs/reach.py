@@ -0,0 +1,126 @@
+#!/usr/bin/python3
+# -*- mode: python; coding: utf-8 -*-
+
+"""Precomputed reachability (transitive closure) of a DAG.
+
+Every node gets a position in topological order and a bitset of the nodes
+it reaches.  The bitsets are built as Python ints in one sweep in reverse
+topological order and stored as little-endian bytes, so `reaches` tests a
+single byte afterwards.
+"""
+
+from dsapy.algs.topsort import _collect, topsort
+
+import sys
+
+
+def _bits(x):
+    """Yield positions of set bits of `x` in increasing order."""
+    s = bin(x)[:1:-1]
+    i = s.find('1')
+    while i >= 0:
+        yield i
+        i = s.find('1', i + 1)
+
+
+def _rows(bitsets, size):
+    """Bitsets as bytes, bit `i` is bit `i % 8` of byte `i // 8`."""
+    n = (size + 7) // 8
+    return [x.to_bytes(n, 'little') for x in bitsets]
+
+
+def _int(row):
+    return int.from_bytes(row, 'little')
+
+
+class ReachabilityIndex(object):
+    """Transitive closure of a DAG given by edges (parent, child).
+
+    Reachability is strict: a node doesn't reach itself.  Ancestor bitsets
+    are only built on first use.  Raise `CycleError` if the graph has cycles.
+
+    >>> r = ReachabilityIndex([(1, 2), (2, 3), (1, 4), (5, 3)], nodes=[6])
+    >>> r.reaches(1, 3), r.reaches(3, 1), r.reaches(5, 4)
+    (True, False, False)
+    >>> r.descendants(1)
+    [2, 4, 3]
+    >>> r.ancestors(3)
+    [1, 5, 2]
+    >>> r.descendants(6), r.count_descendants(1)
+    ([], 3)
+    >>> chain = ReachabilityIndex([(i, i + 1) for i in range(20)])
+    >>> chain.reaches(0, 20), chain.reaches(9, 17), chain.reaches(17, 9), chain.count_ancestors(20)
+    (True, True, False, 20)
+    """
+
+    def __init__(self, edges, nodes=()):
+        edges = list(edges)
+        nodes = list(nodes)
+        infos = _collect(edges, nodes)
+        # Extra nodes may also appear in edges; keep their sorted position.
+        self.order = list(dict.fromkeys(topsort(edges) + nodes))
+        self.position = {n: i for i, n in enumerate(self.order)}
+
+        position = self.position
+        desc = [0] * len(self.order)
+        for i in range(len(self.order) - 1, -1, -1):
+            bits = 0
+            for c in infos[self.order[i]].children:
+                j = position[c]
+                bits |= desc[j] | (1 << j)
+            desc[i] = bits
+        self._desc = _rows(desc, len(self.order))
+        self._infos = infos
+        self._anc = None
+
+    def __len__(self):
+        return len(self.order)
+
+    def __contains__(self, node):
+        return node in self.position
+
+    def reaches(self, a, b):
+        """True if there is a path from `a` to `b`."""
+        j = self.position[b]
+        return bool(self._desc[self.position[a]][j >> 3] >> (j & 7) & 1)
+
+    def descendants(self, node):
+        """Nodes reachable from `node`, in topological order."""
+        order = self.order
+        return [order[i] for i in _bits(_int(self._desc[self.position[node]]))]
+
+    def ancestors(self, node):
+        """Nodes that reach `node`, in topological order."""
+        order = self.order
+        return [order[i] for i in _bits(_int(self._ancestors()[self.position[node]]))]
+
+    def count_descendants(self, node):
+        return bin(_int(self._desc[self.position[node]])).count('1')
+
+    def count_ancestors(self, node):
+        return bin(_int(self._ancestors()[self.position[node]])).count('1')
+
+    def memory_usage(self):
+        """Approximate size of the bitsets and tables in bytes."""
+        size = sys.getsizeof(self._desc) + sum(sys.getsizeof(x) for x in self._desc)
+        if self._anc is not None:
+            size += sys.getsizeof(self._anc) + sum(sys.getsizeof(x) for x in self._anc)
+        size += sys.getsizeof(self.order) + sys.getsizeof(self.position)
+        return size
+
+    def _ancestors(self):
+        if self._anc is None:
+            position = self.position
+            anc = [0] * len(self.order)
+            for i, n in enumerate(self.order):
+                bits = anc[i] | (1 << i)
+                for c in self._infos[n].children:
+                    anc[position[c]] |= bits
+            self._anc = _rows(anc, len(self.order))
+        return self._anc
+
+
+if __name__ == '__main__':
+    # Run the doctest tests.
+    import doctest
+    doctest.testmod(sys.modules['__main__'])
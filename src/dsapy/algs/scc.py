@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+# -*- mode: python; coding: utf-8 -*-
+
+"""Strongly connected components.
+
+Tarjan's algorithm with an explicit stack, so arbitrarily deep graphs don't
+hit the recursion limit.  Runs in O(V + E).
+"""
+
+import collections
+
+
+def components(nodes, exits):
+    """Yield strongly connected components reachable from `nodes`.
+
+    Components come out in reverse topological order: every component is
+    yielded after all components reachable from it.  Nodes inside a
+    component start from the one discovered first.
+
+    >>> exits = {1: [2], 2: [3, 4], 3: [1], 4: [5], 5: [4], 6: [4]}.get
+    >>> list(components([1, 6], exits))
+    [[4, 5], [1, 2, 3], [6]]
+    """
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    counter = 0
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(exits(root)))]
+        while work:
+            node, it = work[-1]
+            for c in it:
+                if c not in index:
+                    index[c] = low[c] = counter
+                    counter += 1
+                    stack.append(c)
+                    on_stack.add(c)
+                    work.append((c, iter(exits(c))))
+                    break
+                if c in on_stack and index[c] < low[node]:
+                    low[node] = index[c]
+            else:
+                work.pop()
+                if work:
+                    p = work[-1][0]
+                    if low[node] < low[p]:
+                        low[p] = low[node]
+                if low[node] == index[node]:
+                    comp = []
+                    while True:
+                        w = stack.pop()
+                        on_stack.discard(w)
+                        comp.append(w)
+                        if w == node:
+                            break
+                    comp.reverse()
+                    yield comp
+
+
+def is_cyclic(component, exits):
+    """True if the component contains a cycle (or is a node with a self-loop)."""
+    if len(component) > 1:
+        return True
+    node = component[0]
+    return any(c == node for c in exits(node))
+
+
+def find_cycle(component, exits):
+    """Return a cycle path inside a cyclic component; first node is repeated at the end.
+
+    >>> exits = {1: [2], 2: [4, 3], 3: [1], 4: [2]}.get
+    >>> find_cycle([1, 2, 3, 4], exits)
+    [2, 4, 2]
+    """
+    members = set(component)
+    pos = {}
+    path = []
+    node = component[0]
+    while node not in pos:
+        pos[node] = len(path)
+        path.append(node)
+        for c in exits(node):
+            if c in members:
+                node = c
+                break
+        else:
+            raise ValueError('Component has no cycle: {!r}'.format(component))
+    return path[pos[node]:] + [node]
+
+
+class Condensation(object):
+    """DAG of strongly connected components of a graph given by edges (parent, child).
+
+    `components` are listed in topological order, `component[node]` is the
+    index of the node's component, and `edges` are (parent, child) pairs of
+    component indexes, so they can be fed to `topsort` or `run_tasks`.
+
+    >>> c = Condensation([(1, 2), (2, 1), (2, 3), (3, 4), (4, 3), (1, 4)], nodes=[5])
+    >>> c.components
+    [[1, 2], [3, 4], [5]]
+    >>> c.edges
+    [(0, 1)]
+    >>> c.component[4]
+    1
+    """
+
+    def __init__(self, edges, nodes=()):
+        children = collections.defaultdict(list)
+        for n in nodes:
+            children[n]
+        for parent, child in edges:
+            children[parent].append(child)
+            children[child]
+
+        comps = list(components(list(children), children.__getitem__))
+        comps.reverse()
+        self.components = comps
+        self.component = {n: i for i, comp in enumerate(comps) for n in comp}
+
+        cedges = {}
+        component = self.component
+        for parent, ps in children.items():
+            cp = component[parent]
+            for child in ps:
+                cc = component[child]
+                if cp != cc:
+                    cedges[cp, cc] = None
+        self.edges = list(cedges)
+
+
+if __name__ == '__main__':
+    # Run the doctest tests.
+    import sys
+    import doctest
+    doctest.testmod(sys.modules['__main__'])
@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+# -*- mode: python; coding: utf-8 -*-
+
+"""Parallel execution of tasks in dependency order."""
+
+from dsapy.algs.error import Error
+from dsapy.algs.topsort import Sorter
+
+import concurrent.futures
+
+
+class TaskError(Error):
+    """Some tasks failed.
+
+    Attributes:
+        - failed: dict of node -> exception;
+        - skipped: nodes that were not run because of the failures;
+        - results: dict of node -> result for tasks that succeeded.
+    """
+
+    def __init__(self, failed, skipped, results):
+        super().__init__(failed, skipped)
+        self.failed = failed
+        self.skipped = skipped
+        self.results = results
+
+
+def _make_executor(executor, jobs):
+    if executor == 'thread':
+        return concurrent.futures.ThreadPoolExecutor(max_workers=jobs)
+    if executor == 'process':
+        return concurrent.futures.ProcessPoolExecutor(max_workers=jobs)
+    raise ValueError('Unknown executor: {!r}'.format(executor))
+
+
+def run_tasks(edges, func, nodes=(), jobs=None, executor='thread', fail_fast=True):
+    """Call `func(node)` for every node, parents before children.
+
+    A node is submitted as soon as all its parents have finished, so
+    independent branches run concurrently on up to `jobs` workers.
+
+    Args:
+        - edges: (parent, child) pairs, as for `topsort`;
+        - func: task function; must be picklable for the process executor;
+        - nodes: extra nodes that may not appear in any edge;
+        - jobs: worker count, executor default if None;
+        - executor: 'thread', 'process' or a `concurrent.futures.Executor`
+          instance (left running on return);
+        - fail_fast: on first failure stop submitting new tasks; otherwise
+          skip only descendants of failed tasks and keep running
+          independent branches.
+
+    Return a dict of node -> result.  Raise `TaskError` if any task failed
+    and `CycleError` if some nodes are blocked by a cycle.  Nodes blocked by
+    a cycle are skipped too; with `fail_fast=False` the `CycleError` is the
+    cause of the `TaskError`.
+
+    >>> run_tasks([(1, 2), (1, 3), (2, 4), (3, 4)], lambda n: n * 10, jobs=2) == {1: 10, 2: 20, 3: 30, 4: 40}
+    True
+
+    >>> def task(n):
+    ...     if n == 2:
+    ...         raise ValueError(n)
+    ...     return n
+    >>> try:
+    ...     run_tasks([(1, 2), (2, 4), (1, 3), (5, 6)], task, fail_fast=False)
+    ... except TaskError as e:
+    ...     print(e.failed, e.skipped, sorted(e.results))
+    {2: ValueError(2)} [4] [1, 3, 5, 6]
+
+    >>> try:
+    ...     run_tasks([(1, 2), (2, 3), (1, 4), (4, 5), (5, 4)], task, fail_fast=False)
+    ... except TaskError as e:
+    ...     print(e.failed, sorted(e.skipped), sorted(e.results), e.__cause__.args[2])
+    {2: ValueError(2)} [3, 4, 5] [1] [[4, 5, 4]]
+    """
+    sorter = Sorter(edges, nodes)
+    results = {}
+    failed = {}
+    skipped = []
+    blocked = set()
+
+    own_pool = isinstance(executor, str)
+    pool = _make_executor(executor, jobs) if own_pool else executor
+    try:
+        running = {}
+        while True:
+            ready = sorter.ready()
+            while ready:
+                for node in ready:
+                    if failed and fail_fast:
+                        continue
+                    if node in blocked:
+                        skipped.append(node)
+                        blocked.update(sorter.children(node))
+                        sorter.done(node)
+                    else:
+                        running[pool.submit(func, node)] = node
+                ready = sorter.ready()
+
+            if not running:
+                break
+
+            finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for f in finished:
+                node = running.pop(f)
+                exc = f.exception()
+                if exc is None:
+                    results[node] = f.result()
+                else:
+                    failed[node] = exc
+                    blocked.update(sorter.children(node))
+                sorter.done(node)
+    finally:
+        if own_pool:
+            pool.shutdown(wait=True)
+
+    # With fail_fast these are the nodes not run after the failure,
+    # otherwise the nodes blocked by a cycle.
+    remaining = sorter.remaining()
+    if failed:
+        error = TaskError(failed, skipped + remaining, results)
+        if remaining and not fail_fast:
+            raise error from sorter.cycle_error()
+        raise error
+    if remaining:
+        raise sorter.cycle_error()
+    return results
+
+
+if __name__ == '__main__':
+    # Run the doctest tests.
+    import sys
+    import doctest
+    doctest.testmod(sys.modules['__main__'])
@@ -4,12 +4,20 @@
 """Topological sorting."""
 
 from dsapy.algs.error import Error
+from dsapy.algs import scc
 
 import collections
+import heapq
 
 
 class CycleError(Error):
-    pass
+    """Graph has cycles.
+
+    `topsort` raises it with args (sorted, components, cycles): the nodes
+    sorted before the cycles blocked the rest, the strongly connected
+    components containing cycles (in topological order) and one cycle path
+    per component, with its first node repeated at the end.
+    """
 
 
 class _NodeInfo(object):
@@ -21,6 +29,27 @@ class _NodeInfo(object):
         return '{{n:{s.n_parents}, c:{s.children}}}'.format(s=self)
 
 
+def _collect(edges, nodes=()):
+    infos = collections.defaultdict(_NodeInfo)
+    for n in nodes:
+        infos[n]
+    for parent, child in edges:
+        infos[parent].children.append(child)
+        infos[child].n_parents += 1
+    return infos
+
+
+def _cycle_error(results, nodes):
+    # Only the nodes blocked by cycles are left, and all their children are
+    # left too, so the components are found without touching sorted nodes.
+    def exits(node):
+        return nodes[node].children
+
+    comps = [c for c in scc.components(list(nodes), exits) if scc.is_cyclic(c, exits)]
+    comps.reverse()
+    return CycleError(results, comps, [scc.find_cycle(c, exits) for c in comps])
+
+
 def topsort(edges):
     """Topologically sort a list of nodes given edges (parent, child).
 
@@ -34,17 +63,13 @@ def topsort(edges):
 
     >>> topsort([(1,2), (2,3), (3,2), (2, 4)])
     Traceback (most recent call last):
-    CycleError: ([1], [(2, 3), (2, 4), (3, 2)])
+    CycleError: ([1], [[2, 3]], [[2, 3, 2]])
 
     >>> topsort([(1, 2), (2, 3), (3, 4), (5, 6), (6, 5), (5, 3)])
     Traceback (most recent call last):
-    CycleError: ([1, 2], [(3, 4), (5, 6), (5, 3), (6, 5)])
+    CycleError: ([1, 2], [[5, 6]], [[5, 6, 5]])
     """
-    nodes = collections.defaultdict(_NodeInfo)
-    for parent, child in edges:
-        nodes[parent].children.append(child)
-        nodes[child].n_parents += 1
-
+    nodes = _collect(edges)
     results = [k for k, v in nodes.items() if not v.n_parents]
     for r in results:
         p_node = nodes.pop(r)
@@ -55,12 +80,209 @@ def topsort(edges):
                 results.append(c)
 
     if nodes:
-        cs = [(parent, child) for parent in nodes for child in nodes[parent].children]
-        raise CycleError(results, cs)
+        raise _cycle_error(results, nodes)
 
     return results
 
 
+class Schedule(object):
+    """Result of `schedule`.
+
+    Attributes:
+        - order: nodes in topological order;
+        - level: dict node -> length of the longest chain of parents;
+        - layers: nodes grouped by level; nodes of a layer are independent;
+        - finish: dict node -> earliest finish time given node costs;
+        - critical_path: the longest weighted chain of nodes;
+        - length: finish time of the critical path.
+    """
+
+    def __init__(self, order, level, finish, critical_path):
+        self.order = order
+        self.level = level
+        self.finish = finish
+        self.critical_path = critical_path
+        self.length = finish[critical_path[-1]] if critical_path else 0
+
+    @property
+    def layers(self):
+        layers = []
+        for n in self.order:
+            lv = self.level[n]
+            while len(layers) <= lv:
+                layers.append([])
+            layers[lv].append(n)
+        return layers
+
+
+def schedule(edges, nodes=(), key=None, cost=None):
+    """Topologically sort and compute levels and the critical path in one pass.
+
+    Args:
+        - edges: (parent, child) pairs;
+        - nodes: extra nodes that may not appear in any edge;
+        - key: if given, ready nodes are taken from a heap by `key(node)`
+          (ties in discovery order) instead of FIFO, which gives a
+          deterministic priority order, e.g. lexicographic with
+          `key=lambda n: n`;
+        - cost: `cost(node)` is the weight of the node for the critical
+          path, 1 for every node if not given.
+
+    >>> s = schedule([(1, 2), (1, 3), (3, 4), (2, 5), (4, 5)], key=lambda n: -n, cost=lambda n: 5 if n == 3 else 1)
+    >>> s.order
+    [1, 3, 4, 2, 5]
+    >>> s.layers
+    [[1], [3, 2], [4], [5]]
+    >>> s.critical_path, s.length
+    ([1, 3, 4, 5], 8)
+    """
+    infos = _collect(edges, nodes)
+    level = {}
+    start = {}
+    finish = {}
+    best_parent = {}
+
+    roots = [k for k, v in infos.items() if not v.n_parents]
+    if key is None:
+        queue = collections.deque(roots)
+        push = queue.append
+        pop = queue.popleft
+    else:
+        counter = iter(range(len(infos)))
+        queue = [(key(n), next(counter), n) for n in roots]
+        heapq.heapify(queue)
+
+        def push(n):
+            heapq.heappush(queue, (key(n), next(counter), n))
+
+        def pop():
+            return heapq.heappop(queue)[2]
+
+    results = []
+    last = None
+    while queue:
+        r = pop()
+        results.append(r)
+        p_node = infos.pop(r)
+        lv = level.setdefault(r, 0)
+        c = cost(r) if cost is not None else 1
+        f = finish[r] = start.get(r, 0) + c
+        if last is None or f > finish[last]:
+            last = r
+        for ch in p_node.children:
+            if level.get(ch, -1) <= lv:
+                level[ch] = lv + 1
+            if ch not in start or start[ch] < f:
+                start[ch] = f
+                best_parent[ch] = r
+            c_node = infos[ch]
+            c_node.n_parents -= 1
+            if not c_node.n_parents:
+                push(ch)
+
+    if infos:
+        raise _cycle_error(results, infos)
+
+    path = []
+    while last is not None:
+        path.append(last)
+        last = best_parent.get(last)
+    path.reverse()
+    return Schedule(results, level, finish, path)
+
+
+def layers(edges, nodes=()):
+    """Group nodes by level: every node comes after all of its parents' layers.
+
+    >>> layers([(1, 2), (1, 3), (2, 4), (3, 4), (5, 4)])
+    [[1, 5], [2, 3], [4]]
+    """
+    return schedule(edges, nodes).layers
+
+
+def priority_sort(edges, key, nodes=()):
+    """Topologically sort taking the ready node with the smallest `key` first.
+
+    >>> priority_sort([(3, 1), (2, 1), (5, 4)], key=lambda n: n)
+    [2, 3, 1, 5, 4]
+    """
+    return schedule(edges, nodes, key=key).order
+
+
+def critical_path(edges, cost, nodes=()):
+    """Return (length, path) of the longest chain weighted by `cost(node)`.
+
+    >>> critical_path([(1, 2), (2, 4), (1, 3), (3, 4)], {1: 1, 2: 2, 3: 3, 4: 1}.get)
+    (5, [1, 3, 4])
+    """
+    s = schedule(edges, nodes, cost=cost)
+    return s.length, s.critical_path
+
+
+class Sorter(object):
+    """Kahn's algorithm driven by the caller.
+
+    Nodes are handed out by `ready` as soon as all their parents are
+    reported `done`, so independent nodes can be processed concurrently.
+    `nodes` lists extra nodes that may not appear in any edge.
+
+    >>> s = Sorter([(1, 2), (1, 3), (2, 4), (3, 4)])
+    >>> s.ready()
+    [1]
+    >>> s.done(1)
+    >>> s.ready()
+    [2, 3]
+    >>> s.done(3)
+    >>> s.ready()
+    []
+    >>> s.done(2)
+    >>> s.ready(), s.is_active()
+    ([4], True)
+    >>> s.done(4)
+    >>> s.is_active(), s.order
+    (False, [1, 3, 2, 4])
+    """
+
+    def __init__(self, edges, nodes=()):
+        self._nodes = _collect(edges, nodes)
+        self._ready = [k for k, v in self._nodes.items() if not v.n_parents]
+        self._n_out = 0
+        self.order = []
+
+    def ready(self):
+        """Return nodes that became ready since the last call."""
+        ready = self._ready
+        self._ready = []
+        self._n_out += len(ready)
+        return ready
+
+    def done(self, node):
+        """Mark a node returned by `ready` as processed."""
+        p_node = self._nodes.pop(node)
+        self._n_out -= 1
+        self.order.append(node)
+        for c in p_node.children:
+            c_node = self._nodes[c]
+            c_node.n_parents -= 1
+            if not c_node.n_parents:
+                self._ready.append(c)
+
+    def children(self, node):
+        return self._nodes[node].children
+
+    def is_active(self):
+        """True while some nodes are ready or handed out but not done."""
+        return bool(self._ready) or self._n_out > 0
+
+    def remaining(self):
+        """Nodes not done yet."""
+        return list(self._nodes)
+
+    def cycle_error(self):
+        """CycleError for nodes blocked after the sorter is no longer active."""
+        return _cycle_error(list(self.order), self._nodes)
+
+
 if __name__ == '__main__':
     # Run the doctest tests.
     import sys
@@ -3,16 +3,23 @@
 
 """Base application framework."""
 
-from typing import Any
+from typing import Any, Callable, Iterable, Iterator, Optional, Tuple
 
+import collections
+import concurrent.futures
+import itertools
 import logging
+import multiprocessing
+import os
 import sys
 
 from .base_app import \
     Error, BrokenWrapperError, \
-    init, fini, onmain, onwrapmain, main, start, \
-    get_commands, \
+    init, fini, onmain, onwrapmain, onexit, main, start, \
+    lazy_main, entry_point_mains, get_commands, \
+    Timing, get_timings, \
     KwArgsGenerator  # noqa: F401
+from . import base_app
 from . import base_flag  # noqa: F401
 
 _logger = logging.getLogger(__name__)
@@ -37,12 +44,12 @@ class _commandMeta(type):
         if skip:
             return new_cls
 
-        def main_func(**kwargs):
-            return new_cls(**kwargs).main()
+        main_func = base_app._class_main(new_cls)
 
-        add_arguments = getattr(new_cls, 'add_arguments', None)
-        if add_arguments:
-            main_func.add_arguments = add_arguments
+        # E.g. `cache.cached(...)`, see dsapy.cache.
+        cached = getattr(new_cls, 'cached', None)
+        if cached is not None:
+            main_func = cached(main_func)
 
         main(
             name=getattr(new_cls, 'name', name),
@@ -67,3 +74,168 @@ class Command(metaclass=_commandMeta, skip=True):
 
     def main(self):
         return
+
+
+class ParallelCommand(Command, skip=True):
+    """Base class for subcommand that maps a function over many inputs.
+
+    Adds `--jobs` and `--executor` flags; subclasses that define their own
+    `add_arguments` must call `super().add_arguments(argparser)`.  With the
+    process executor the mapped function and its inputs must be picklable,
+    e.g. a module-level function.
+    """
+
+    executor = 'process'
+    chunksize = 1
+
+    @classmethod
+    def add_arguments(cls, argparser):
+        argparser.add_argument(
+            '--jobs', '-j',
+            type=int,
+            default=os.cpu_count() or 1,
+            metavar='N',
+            help='Number of workers',
+        )
+        argparser.add_argument(
+            '--executor',
+            choices=['thread', 'process'] + (['fork'] if hasattr(os, 'fork') else []),
+            default=cls.executor,
+            help='Run workers in threads, in processes or in processes forked from this one',
+        )
+
+    def make_executor(self) -> concurrent.futures.Executor:
+        '''Creates executor selected by the flags.
+
+        Worker processes get the logging level and format of the parent.
+        '''
+        if self.flags.executor == 'thread':
+            return concurrent.futures.ThreadPoolExecutor(max_workers=self.flags.jobs)
+        root_logger = logging.getLogger()
+        if self.flags.executor == 'fork':
+            return fork_executor(
+                max_workers=self.flags.jobs,
+                initializer=_init_worker_logging,
+                initargs=(root_logger.level, None, True),
+            )
+        formatter = root_logger.handlers[0].formatter if root_logger.handlers else None
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.flags.jobs,
+            initializer=_init_worker_logging,
+            initargs=(root_logger.level, formatter, multiprocessing.get_start_method() == 'fork'),
+        )
+
+    def imap(
+            self,
+            func: Callable[[Any], Any],
+            iterable: Iterable[Any],
+            chunksize: Optional[int] = None,
+            ordered: bool = True,
+            max_in_flight: Optional[int] = None,
+            executor: Optional[concurrent.futures.Executor] = None,
+    ) -> Iterator[Any]:
+        '''Yields `func(item)` for every item of `iterable`.
+
+        Items are sent to workers in chunks of `chunksize`.  No more than
+        `max_in_flight` chunks (twice the number of jobs by default) are
+        submitted at a time, so `iterable` is consumed only as fast as
+        results are, and may be infinite.  With `ordered` results come in
+        the order of inputs, otherwise as soon as a chunk is done.  The
+        first exception raised by `func` is raised here, and chunks not
+        started yet are cancelled.
+
+        `executor` is created with `make_executor` and shut down afterwards
+        if not given.
+        '''
+        if chunksize is None:
+            chunksize = self.chunksize
+        if max_in_flight is None:
+            max_in_flight = 2 * self.flags.jobs
+        if executor is None:
+            with self.make_executor() as executor:
+                yield from self.imap(func, iterable, chunksize, ordered, max_in_flight, executor)
+            return
+
+        chunks = _chunked(iterable, chunksize)
+        in_flight: Any = collections.deque() if ordered else set()
+        add = in_flight.append if ordered else in_flight.add
+        try:
+            while True:
+                for chunk in itertools.islice(chunks, max_in_flight - len(in_flight)):
+                    add(executor.submit(_run_chunk, func, chunk))
+                if not in_flight:
+                    return
+
+                done: Any
+                if ordered:
+                    done = [in_flight.popleft()]
+                else:
+                    done, _ = concurrent.futures.wait(in_flight, return_when=concurrent.futures.FIRST_COMPLETED)
+                    in_flight.difference_update(done)
+                for future in done:
+                    yield from future.result()
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+
+def fork_executor(
+        max_workers: Optional[int] = None,
+        initializer: Optional[Callable[..., Any]] = None,
+        initargs: Tuple[Any, ...] = (),
+        prewarm: bool = True,
+) -> concurrent.futures.ProcessPoolExecutor:
+    '''Creates process pool with workers forked from the current process.
+
+    Call it from main, after `start` has run init and onmain handlers:
+    workers inherit parsed flags, imported modules and configured logging,
+    so a task doesn't pay for imports or initialization.  With `prewarm`
+    all workers are started before returning, so the first tasks don't
+    wait for them.
+    '''
+    try:
+        mp_context = multiprocessing.get_context('fork')
+    except ValueError as e:
+        raise Error('fork is not supported on the platform') from e
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    executor = concurrent.futures.ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=mp_context,
+        initializer=initializer,
+        initargs=initargs,
+    )
+    if prewarm:
+        for future in [executor.submit(_noop) for _ in range(max_workers)]:
+            future.result()
+    return executor
+
+
+def _noop():
+    pass
+
+
+def _chunked(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _run_chunk(func, chunk):
+    return [func(item) for item in chunk]
+
+
+def _init_worker_logging(level, formatter, forked):
+    # Forked workers inherit the configured handlers; others start with
+    # whatever importing modules set up and need the parent's configuration.
+    root_logger = logging.getLogger()
+    if not forked:
+        root_logger.handlers = []
+        handler = logging.StreamHandler()
+        if formatter is not None:
+            handler.setFormatter(formatter)
+        root_logger.addHandler(handler)
+    root_logger.setLevel(level)
@@ -1,11 +1,13 @@
 #!/usr/bin/python3
 # -*- mode: python; coding: utf-8 -*-
 
+import json
 import os
 import os.path
 import shutil
 import subprocess
 import tempfile
+import time
 import unittest
 
 
@@ -226,6 +228,860 @@ optional arguments:
         self.assertEqual('', err)
         self.assertEqual('cmdone\n', out)
 
+    def test_lazy_subcommands(self):
+        self._module('main', '''
+from dsapy import app
+
+def _args(name):
+    def add_arguments(parser):
+        print('add_arguments ' + name)
+        parser.add_argument('--who', default='world')
+    return add_arguments
+
+@app.main(add_arguments=_args('one'), help='First command.')
+def one(flags, **kwargs):
+    print('one: ' + flags.who)
+
+@app.main(add_arguments=_args('two'), help='Second command.')
+def two(flags, **kwargs):
+    print('two: ' + flags.who)
+
+app.start(lazy_subcommands=True)
+''')
+        out, err = self._run_module('main', 'two', '--who=you')
+        self.assertEqual('', err)
+        self.assertEqual('add_arguments two\ntwo: you\n', out)
+
+        out, err = self._run_module('main', '-h')
+        self.assertEqual('', err)
+        self.assertNotIn('add_arguments', out)
+        self.assertIn('First command.', out)
+        self.assertIn('Second command.', out)
+
+        out, err = self._run_module('main', 'three')
+        self.assertEqual('', out)
+        self.assertIn("invalid choice: 'three'", err)
+
+    def test_lazy_main(self):
+        self._module('main', '''
+import asyncio
+from dsapy import app
+
+app.lazy_main('cmdone:CmdOne', name='one', help='First command.')
+app.lazy_main('cmdtwo:two', help='Second command.')
+app.lazy_main('cmdthree:three')
+
+@app.onmain
+def loop(**kwargs):
+    try:
+        asyncio.get_running_loop()
+        print('in loop')
+    except RuntimeError:
+        print('no loop')
+    yield kwargs
+
+app.start()
+''')
+
+        self._module('cmdone', '''
+from dsapy import app
+
+print('import cmdone')
+
+class CmdOne(app.Command):
+    @classmethod
+    def add_arguments(cls, argparser):
+        argparser.add_argument('--who', default='world')
+
+    def main(self):
+        print('one: ' + self.flags.who)
+''')
+
+        self._module('cmdtwo', '''
+print('import cmdtwo')
+
+def two(**kwargs):
+    print('two')
+''')
+
+        self._module('cmdthree', '''
+async def three(**kwargs):
+    print('three')
+''')
+
+        out, err = self._run_module('main', 'one', '--who=you')
+        self.assertEqual('', err)
+        self.assertEqual('import cmdone\nno loop\none: you\n', out)
+
+        out, err = self._run_module('main', 'two')
+        self.assertEqual('', err)
+        self.assertEqual('import cmdtwo\nno loop\ntwo\n', out)
+
+        # Lazy async main runs on the loop of the async path.
+        out, err = self._run_module('main', 'three')
+        self.assertEqual('', err)
+        self.assertEqual('in loop\nthree\n', out)
+
+        out, err = self._run_module('main', '-h')
+        self.assertEqual('', err)
+        self.assertNotIn('import', out)
+        self.assertIn('First command.', out)
+
+    def test_lazy_cached_command(self):
+        self._module('main', '''
+import asyncio
+from dsapy import app
+
+app.lazy_main('cmdone:CmdOne', name='one')
+app.lazy_main('cmdtwo:two')
+
+app.start()
+''')
+
+        self._module('cmdone', '''
+import sys
+from dsapy import app
+from dsapy import cache
+
+class CmdOne(app.Command):
+    cached = cache.cached(flags=['who'])
+
+    @classmethod
+    def add_arguments(cls, argparser):
+        argparser.add_argument('--who', default='world')
+
+    def main(self):
+        print('computing', file=sys.stderr)
+        print('one: ' + self.flags.who)
+''')
+
+        self._module('cmdtwo', '''
+def two(**kwargs):
+    print('two')
+''')
+
+        cache_dir = os.path.join(self.tempdir, 'cache')
+        out, err = self._run_module('main', 'one', '--cache-dir', cache_dir)
+        self.assertEqual('computing\n', err)
+        self.assertEqual('one: world\n', out)
+        out, err = self._run_module('main', 'one', '--cache-dir', cache_dir)
+        self.assertEqual('', err)
+        self.assertEqual('one: world\n', out)
+
+    def test_profile_startup(self):
+        self._module('main', '''
+from dsapy import profiling
+from dsapy import app
+
+@app.init
+def slow_init(**kwargs):
+    pass
+
+@app.main()
+def m(**kwargs):
+    print('m')
+
+app.start()
+''')
+        report = os.path.join(self.tempdir, 'report.json')
+        out, err = self._run_module(
+            'main', '--profile-startup', '--profile-format=json', '--profile-output=' + report,
+            '--profile-main=' + os.path.join(self.tempdir, 'main.prof'),
+        )
+        self.assertEqual('', err)
+        self.assertEqual('m\n', out)
+        with open(report) as f:
+            timings = json.load(f)
+        phases = [(t['phase'], t['name']) for t in timings]
+        self.assertIn(('init', '__main__.slow_init'), phases)
+        self.assertIn(('main', '__main__.m'), phases)
+        self.assertEqual(
+            ['onwrapmain', 'imports', 'init', 'init', 'onmain', 'onmain', 'main', 'onmain-exit', 'onmain-exit'],
+            [p for p, _ in phases],
+        )
+        self.assertTrue(os.path.exists(os.path.join(self.tempdir, 'main.prof')))
+
+    def test_async_main(self):
+        self._module('main', '''
+import asyncio
+from dsapy import aio
+from dsapy import app
+
+@app.onmain
+def a(**kwargs):
+    print('a begin')
+    yield kwargs
+    print('a end')
+
+@app.onmain
+async def b(**kwargs):
+    print('b begin')
+    kwargs['loop'] = asyncio.get_running_loop()
+    yield kwargs
+    await asyncio.sleep(0)
+    print('b end')
+
+class Cmd(app.Command):
+    name = 'cmd'
+
+    async def main(self):
+        await asyncio.sleep(0)
+        print('cmd', self.loop is asyncio.get_running_loop())
+
+@app.main()
+def other(**kwargs):
+    print('other')
+
+app.start()
+''')
+        out, err = self._run_module('main', 'cmd', '--event-loop=asyncio')
+        self.assertEqual('', err)
+        self.assertEqual('a begin\nb begin\ncmd True\nb end\na end\n', out)
+
+    def test_daemon(self):
+        self._module('main', '''
+import atexit
+import os
+import sys
+from dsapy import app
+from dsapy import daemon
+from dsapy import profiling
+
+STATE = []
+atexit.register(print, 'server exit')
+
+@app.main()
+def echo(flags, **kwargs):
+    STATE.append(1)
+    print('echo', os.environ.get('ECHO_VAR'), os.getcwd() == os.environ['EXPECTED_CWD'], len(STATE))
+    print(sys.stdin.read().upper(), end='')
+    sys.exit(3)
+
+daemon.run()
+''')
+        sock = os.path.join(self.tempdir, 'main.sock')
+        env = os.environ.copy()
+        env['PYTHONPATH'] = self.tempdir
+        env['DSAPY_SERVE'] = sock
+        server = subprocess.Popen(['python3', self._mpath('main')], env=env)
+        try:
+            for _ in range(100):
+                if os.path.exists(sock):
+                    break
+                time.sleep(0.05)
+            self.assertEqual(0o600, os.stat(sock).st_mode & 0o777)
+
+            env = os.environ.copy()
+            env['PYTHONPATH'] = self.tempdir
+            env['ECHO_VAR'] = 'value'
+            env['EXPECTED_CWD'] = self.tempdir
+            for _ in range(2):
+                p = subprocess.run(
+                    ['python3', '-m', 'dsapy.daemon', sock],
+                    input='hello\n',
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.PIPE,
+                    universal_newlines=True,
+                    env=env,
+                    cwd=self.tempdir,
+                )
+                self.assertEqual('', p.stderr)
+                self.assertEqual('echo value True 1\nHELLO\n', p.stdout)
+                self.assertEqual(3, p.returncode)
+
+            report = os.path.join(self.tempdir, 'report.json')
+            p = subprocess.run(
+                ['python3', '-m', 'dsapy.daemon', sock,
+                 '--profile-startup', '--profile-format=json', '--profile-output=' + report],
+                input='',
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+                env=env,
+                cwd=self.tempdir,
+            )
+            self.assertEqual('', p.stderr)
+            self.assertEqual(3, p.returncode)
+            with open(report) as f:
+                phases = [(t['phase'], t['name']) for t in json.load(f)]
+            self.assertIn(('main', '__main__.echo'), phases)
+        finally:
+            server.terminate()
+            server.wait()
+
+    def test_dependent_handlers(self):
+        self._module('main', '''
+import threading
+from dsapy import app
+
+both_running = threading.Barrier(2, timeout=10)
+
+@app.init(requires=['a', 'b'])
+def c(a, b, **kwargs):
+    print('c', a, b)
+
+@app.init(provides=['a'])
+def a(**kwargs):
+    both_running.wait()
+    return {'a': 1}
+
+@app.init(provides=['b'])
+def b(**kwargs):
+    both_running.wait()
+    return {'b': 2}
+
+@app.onmain(requires=['db'])
+def use_db(**kwargs):
+    print('use_db', kwargs['db'])
+    yield kwargs
+
+@app.onmain
+def plain(**kwargs):
+    print('plain')
+    yield kwargs
+
+@app.onmain(provides=['db'], requires=['a'])
+def open_db(**kwargs):
+    kwargs['db'] = 'db{}'.format(kwargs['a'])
+    yield kwargs
+
+@app.main()
+def m(**kwargs):
+    print('m')
+
+app.start()
+''')
+        out, err = self._run_module('main')
+        self.assertEqual('', err)
+        self.assertEqual('c 1 2\nplain\nuse_db db1\nm\n', out)
+
+    def test_dependent_handlers_cycle(self):
+        self._module('main', '''
+from dsapy import app
+from dsapy.algs import topsort
+
+@app.init(provides=['a'], requires=['b'])
+def a(**kwargs):
+    pass
+
+@app.init(provides=['b'], requires=['a'])
+def b(**kwargs):
+    pass
+
+@app.main()
+def m(**kwargs):
+    print('m')
+
+try:
+    app.start()
+except topsort.CycleError as e:
+    print('cycle', len(e.args[2][0]))
+''')
+        out, err = self._run_module('main')
+        self.assertEqual('', err)
+        self.assertEqual('cycle 3\n', out)
+
+    def test_batch(self):
+        self._module('main', '''
+import sys
+from dsapy import app
+from dsapy import flag
+
+@flag.argroup('Greeting')
+def _greeting(argroup):
+    argroup.add_argument('--greeting', default='hi')
+
+@app.onmain
+def once(**kwargs):
+    print('onmain')
+    yield kwargs
+
+@app.main()
+def one(**kwargs):
+    print('one: {} {}'.format(kwargs['flags'].greeting, kwargs['flags'].who))
+
+@app.main()
+def fail(**kwargs):
+    sys.exit(3)
+
+@app.main()
+def own(**kwargs):
+    print('own: ' + kwargs['flags'].batch)
+
+def _one_arguments(argparser):
+    argparser.add_argument('--who', default='world')
+
+one.add_arguments = _one_arguments
+own.add_arguments = lambda argparser: argparser.add_argument('--batch')
+
+app.start(batch=True)
+''')
+        batch = os.path.join(self.tempdir, 'batch.txt')
+        status = os.path.join(self.tempdir, 'status.txt')
+        with open(batch, 'w') as f:
+            f.write('one\n# comment\n\none --who "a b"\nfail\none --who=c\none --greeting=x\n')
+
+        out, err = self._run_module('main', '--greeting=hey', '--batch', batch, '--batch-status', status)
+        self.assertEqual('onmain\none: hey world\none: hey a b\none: hey c\n', out)
+        self.assertIn('Batch line 5 failed with status 3', err)
+        # Global flags are not accepted on batch lines.
+        self.assertIn('unrecognized arguments: --greeting=x', err)
+        with open(status) as f:
+            self.assertEqual('1\t0\n4\t0\n5\t3\n6\t0\n7\t2\n', f.read())
+
+        out, err = self._run_module('main', 'one', '--who=x')
+        self.assertEqual('', err)
+        self.assertEqual('onmain\none: hi x\n', out)
+
+        # Subcommand's own --batch is not the batch mode flag.
+        out, err = self._run_module('main', 'own', '--batch', 'x')
+        self.assertEqual('', err)
+        self.assertEqual('onmain\nown: x\n', out)
+
+    def test_batch_async(self):
+        self._module('main', '''
+import asyncio
+import sys
+from dsapy import app
+
+@app.onmain
+async def loop(**kwargs):
+    kwargs['loop'] = asyncio.get_running_loop()
+    yield kwargs
+    print('onmain end')
+
+# Lines may run concurrently, write every output line at once.
+@app.main()
+async def one(**kwargs):
+    await asyncio.sleep(0)
+    sys.stdout.write('one {} {}\\n'.format(kwargs['flags'].who, kwargs['loop'] is asyncio.get_running_loop()))
+
+@app.main()
+def two(**kwargs):
+    sys.stdout.write('two {}\\n'.format(kwargs['flags'].who))
+
+def _who(argparser):
+    argparser.add_argument('--who', default='world')
+
+one.add_arguments = _who
+two.add_arguments = _who
+
+app.start(batch=True)
+''')
+        batch = os.path.join(self.tempdir, 'batch.txt')
+        with open(batch, 'w') as f:
+            f.write('one\ntwo --who=b\none --who=c\n')
+
+        out, err = self._run_module('main', '--batch', batch)
+        self.assertEqual('', err)
+        self.assertEqual('one world True\ntwo b\none c True\nonmain end\n', out)
+
+        out, err = self._run_module('main', '--batch', batch, '--batch-jobs=2')
+        self.assertEqual('', err)
+        self.assertEqual(
+            ['one c True', 'one world True', 'onmain end', 'two b'],
+            sorted(out.splitlines()),
+        )
+
+    def test_parallel_command(self):
+        self._module('main', '''
+import logging
+from dsapy import app
+from dsapy import logs
+
+def square(x):
+    if x == 3:
+        logging.info('three')
+    return x * x
+
+class Squares(app.ParallelCommand):
+    @classmethod
+    def add_arguments(cls, argparser):
+        super().add_arguments(argparser)
+        argparser.add_argument('--unordered', action='store_true')
+
+    def main(self):
+        results = self.imap(square, range(10), chunksize=3, ordered=not self.flags.unordered)
+        print(sorted(results) if self.flags.unordered else list(results))
+
+app.start()
+''')
+        squares = '[0, 1, 4, 9, 16, 25, 36, 49, 64, 81]\n'
+        for args in (['--executor=thread'], ['--executor=process'], ['--executor=fork'], ['-j2', '--unordered']):
+            out, err = self._run_module('main', '--log-level=info', *args)
+            self.assertEqual('three\n', err)
+            self.assertEqual(squares, out)
+
+    def test_rusage(self):
+        self._module('main', '''
+from dsapy import rusage
+from dsapy import app
+
+@app.main()
+def m(**kwargs):
+    if kwargs['flags'].fail:
+        raise ValueError('failed')
+    print('m')
+
+m.add_arguments = lambda argparser: argparser.add_argument('--fail', action='store_true')
+
+app.start()
+''')
+        report = os.path.join(self.tempdir, 'rusage.jsonl')
+        out, err = self._run_module('main', '--rusage', '--rusage-tracemalloc', '--rusage-file', report)
+        self.assertEqual('', err)
+        self.assertEqual('m\n', out)
+        out, err = self._run_module('main', '--rusage', '--rusage-file', report, '--fail')
+        self.assertIn('ValueError: failed', err)
+
+        with open(report) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([0, 1], [r['status'] for r in records])
+        self.assertIn('tracemalloc_peak', records[0])
+        self.assertNotIn('tracemalloc_peak', records[1])
+        for r in records:
+            self.assertGreater(r['max_rss'], 0)
+            self.assertGreaterEqual(r['wall'], 0)
+            self.assertEqual(3, len(r['gc_collections']))
+
+    def test_cache(self):
+        self._module('main', '''
+import sys
+from dsapy import app
+from dsapy import cache
+
+class Count(app.Command):
+    cached = cache.cached(flags=['upper'], files=['input'], artifacts=['output'])
+
+    @classmethod
+    def add_arguments(cls, argparser):
+        argparser.add_argument('input')
+        argparser.add_argument('--output')
+        argparser.add_argument('--upper', action='store_true')
+
+    def main(self):
+        print('computing', file=sys.stderr)
+        with open(self.flags.input) as f:
+            text = f.read()
+        if self.flags.upper:
+            text = text.upper()
+        print(len(text.split()))
+        with open(self.flags.output, 'w') as f:
+            f.write(text)
+
+app.start()
+''')
+        cache_dir = os.path.join(self.tempdir, 'cache')
+        src = os.path.join(self.tempdir, 'input.txt')
+        dst = os.path.join(self.tempdir, 'output.txt')
+
+        def run(*args):
+            out, err = self._run_module('main', src, '--output', dst, '--cache-dir', cache_dir, *args)
+            with open(dst) as f:
+                return out, err, f.read()
+
+        with open(src, 'w') as f:
+            f.write('a b c')
+        self.assertEqual(('3\n', 'computing\n', 'a b c'), run())
+        os.unlink(dst)
+        self.assertEqual(('3\n', '', 'a b c'), run())
+        self.assertEqual(('3\n', 'computing\n', 'A B C'), run('--upper'))
+        self.assertEqual(('3\n', 'computing\n', 'a b c'), run('--no-cache'))
+
+        with open(src, 'w') as f:
+            f.write('a b')
+        self.assertEqual(('2\n', 'computing\n', 'a b'), run())
+        self.assertEqual(('2\n', '', 'a b'), run())
+
+        self.assertEqual(('2\n', 'computing\n', 'A B'), run('--upper', '--cache-size=0'))
+        self.assertEqual([], os.listdir(cache_dir))
+
+    def test_cache_store_errors(self):
+        self._module('main', '''
+import os
+from dsapy import app
+from dsapy import cache
+
+def _arguments(argparser):
+    argparser.add_argument('n', type=int)
+    argparser.add_argument('--output')
+
+@app.main(add_arguments=_arguments)
+@cache.cached(flags=['n'], artifacts=['output'])
+def m(flags, **kwargs):
+    print(flags.n)
+    if os.path.isdir(os.path.dirname(flags.output)):
+        open(flags.output, 'w').close()
+
+app.start()
+''')
+        cache_dir = os.path.join(self.tempdir, 'cache')
+        env = os.environ.copy()
+        env['PYTHONPATH'] = self.tempdir
+        runs = [
+            subprocess.Popen(
+                ['python3', self._mpath('main'), '1', '--cache-dir', cache_dir,
+                 '--output', os.path.join(self.tempdir, 'out{}'.format(i))],
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                universal_newlines=True,
+                env=env,
+            )
+            for i in range(8)
+        ]
+        for p in runs:
+            out, err = p.communicate()
+            self.assertEqual(('1\n', '', 0), (out, err, p.returncode))
+
+        # Declared artifact is not produced.
+        out, err = self._run_module('main', '2', '--cache-dir', cache_dir, '--output', self.tempdir + '/missing/out')
+        self.assertEqual('2\n', out)
+        self.assertIn('Failed to cache result', err)
+
+    def test_log_async(self):
+        self._module('main', '''
+from dsapy import app
+from dsapy import logs
+
+@app.main()
+def m(flags, **kwargs):
+    for i in range(flags.n):
+        logs.info('record %d', i)
+    logs.debug('hidden')
+    if flags.fail:
+        raise ValueError('failed')
+
+def _args(argparser):
+    argparser.add_argument('-n', type=int, default=3)
+    argparser.add_argument('--fail', action='store_true')
+
+m.add_arguments = _args
+
+app.start()
+''')
+        out, err = self._run_module('main', '--log-async', '--log-level=info')
+        self.assertEqual('', out)
+        self.assertEqual('record 0\nrecord 1\nrecord 2\n', err)
+
+        out, err = self._run_module('main', '--log-async', '--log-level=info', '--fail')
+        self.assertIn('record 2\nUnhandled exception\nTraceback', err)
+        self.assertIn('ValueError: failed', err)
+
+        out, err = self._run_module(
+            'main', '--log-async', '--log-level=info', '--log-queue-size=1', '--log-overflow=count', '-n', '10000',
+        )
+        lines = err.splitlines()
+        self.assertRegex(lines[-1], r'^Dropped \d+ log records$')
+        dropped = int(lines[-1].split()[1])
+        self.assertGreater(dropped, 0)
+        self.assertEqual(10000, len(lines) - 1 + dropped)
+
+    def test_log_json(self):
+        self._module('main', '''
+from dsapy import app
+from dsapy import logs
+
+@app.main()
+def m(**kwargs):
+    logs.info('hello %s', 'world', extra={'user': 'me', 'obj': object()})
+    try:
+        1 / 0
+    except ZeroDivisionError:
+        logs.error('failed', exc_info=True)
+
+app.start()
+''')
+        for args in ([], ['--log-async']):
+            out, err = self._run_module('main', '--log-format=json', *args)
+            self.assertEqual('', out)
+            records = [json.loads(line) for line in err.splitlines()]
+            self.assertEqual(2, len(records))
+            hello, failed = records
+            self.assertEqual(['ts', 'level', 'logger', 'msg', 'user', 'obj'], list(hello))
+            self.assertEqual(('INFO', 'root', 'hello world', 'me'), (
+                hello['level'], hello['logger'], hello['msg'], hello['user'],
+            ))
+            self.assertIn('object object at', hello['obj'])
+            self.assertEqual('failed', failed['msg'])
+            self.assertIn('ZeroDivisionError', failed['exc'])
+
+    def test_log_file(self):
+        self._module('main', '''
+import os
+from dsapy import app
+from dsapy import logs
+
+def _size(flags):
+    # In async mode the file is opened by the listener thread, maybe later.
+    if not os.path.exists(flags.log_file):
+        return 0
+    with open(flags.log_file) as f:
+        return len(f.read())
+
+@app.main()
+def m(flags, **kwargs):
+    for i in range(flags.n):
+        logs.info('record %d', i)
+    print(_size(flags))
+    logs.error('error')
+    print(_size(flags))
+
+m.add_arguments = lambda argparser: argparser.add_argument('-n', type=int, default=3)
+
+app.start()
+''')
+        log = os.path.join(self.tempdir, 'main.log')
+        out, err = self._run_module('main', '--log-level=info', '--log-file', log, '--log-flush-interval=60')
+        self.assertEqual('', err)
+        self.assertEqual('0\n33\n', out)
+        with open(log) as f:
+            self.assertEqual('record 0\nrecord 1\nrecord 2\nerror\n', f.read())
+
+        out, err = self._run_module('main', '--log-level=info', '--log-file', log, '--log-flush-interval=0')
+        self.assertEqual('', err)
+        self.assertEqual('60\n66\n', out)
+
+        os.unlink(log)
+        out, err = self._run_module(
+            'main', '--log-level=info', '--log-file', log, '--log-async',
+            '--log-rotate-size=100', '--log-rotate-count=2', '-n', '100',
+        )
+        self.assertEqual('', err)
+        self.assertEqual(['main.log', 'main.log.1', 'main.log.2'], sorted(
+            n for n in os.listdir(self.tempdir) if n.startswith('main.log')
+        ))
+        with open(log) as f:
+            self.assertTrue(f.read().endswith('record 99\nerror\n'))
+
+    def test_log_ring(self):
+        self._module('main', '''
+import os
+import signal
+from dsapy import app
+from dsapy import logs
+
+@app.main()
+def m(flags, **kwargs):
+    for i in range(10):
+        logs.debug('debug %d', i)
+    for i in range(flags.repeat):
+        logs.info('info')
+    if flags.signal:
+        os.kill(os.getpid(), signal.SIGUSR1)
+    else:
+        raise ValueError('failed')
+
+def _arguments(argparser):
+    argparser.add_argument('--signal', action='store_true')
+    argparser.add_argument('--repeat', type=int, default=1)
+
+m.add_arguments = _arguments
+
+app.start()
+''')
+        out, err = self._run_module('main', '--log-level=info', '--log-ring=3')
+        lines = err.splitlines()
+        self.assertEqual(['info', '---- Last 3 log records ----'], lines[:2])
+        self.assertRegex(lines[2], r' DEBUG root@\d+: debug 8$')
+        self.assertRegex(lines[3], r' DEBUG root@\d+: debug 9$')
+        self.assertRegex(lines[4], r' INFO root@\d+: info$')
+        self.assertEqual(['---- End of log records ----', 'Unhandled exception'], lines[5:7])
+        self.assertIn('ValueError: failed', err)
+
+        out, err = self._run_module('main', '--log-level=info', '--log-ring=2', '--signal')
+        lines = err.splitlines()
+        self.assertEqual(5, len(lines))
+        self.assertEqual(['info', '---- Last 2 log records ----'], lines[:2])
+        self.assertRegex(lines[3], r' INFO root@\d+: info$')
+
+        out, err = self._run_module('main', '--log-level=info', '--signal')
+        self.assertEqual('info\n', err)
+
+        # Queued records are written before the dump.
+        for args in (['--signal'], []):
+            out, err = self._run_module(
+                'main', '--log-level=info', '--log-ring=2', '--log-async', '--repeat=2000', *args,
+            )
+            lines = err.splitlines()
+            self.assertEqual(['info'] * 2000 + ['---- Last 2 log records ----'], lines[:2001])
+            self.assertEqual('---- End of log records ----', lines[2003])
+
+    def test_log_ring_fork(self):
+        self._module('main', '''
+import os
+from dsapy import app
+from dsapy import logs
+
+@app.main()
+def m(**kwargs):
+    pid = os.fork()
+    if pid == 0:
+        logs.debug('child debug')
+        logs.info('child info')
+        os._exit(0)
+    os.waitpid(pid, 0)
+    logs.debug('parent debug')
+    logs.info('parent info')
+
+app.start()
+''')
+        for args in (['--log-async'], []):
+            out, err = self._run_module('main', '--log-level=info', '--log-ring=3', *args)
+            self.assertEqual('child info\nparent info\n', err)
+
+    def test_log_filters_fork(self):
+        self._module('main', '''
+import os
+from dsapy import app
+from dsapy import logs
+
+@app.main()
+def m(**kwargs):
+    pid = os.fork()
+    if pid == 0:
+        for _ in range(3):
+            logs.info('same')
+        logs.info('other')
+        os._exit(0)
+    os.waitpid(pid, 0)
+
+app.start()
+''')
+        out, err = self._run_module('main', '--log-level=info', '--log-async', '--log-dedup')
+        self.assertEqual('same\nPrevious message repeated 2 times\nother\n', err)
+
+    def test_log_filters(self):
+        self._module('main', '''
+from dsapy import app
+from dsapy import logs
+
+@app.main()
+def m(**kwargs):
+    for i in range(10):
+        logs.debug('debug %d', i)
+    for i in range(5):
+        logs.warning('same')
+    logs.info('other')
+    for i in range(3):
+        logs.info('last')
+
+app.start()
+''')
+        out, err = self._run_module('main', '--log-level=debug', '--log-format=%(message)s', '--log-sample=debug=4')
+        self.assertEqual(['debug 0', 'debug 4', 'debug 8'], err.splitlines()[:3])
+
+        out, err = self._run_module('main', '--log-level=info', '--log-rate-limit=0.01/2')
+        self.assertEqual('same\nsame\nother\nlast\nlast\n', err)
+
+        for args in ([], ['--log-async']):
+            out, err = self._run_module('main', '--log-level=info', '--log-dedup', *args)
+            self.assertEqual(
+                'same\nPrevious message repeated 4 times\nother\nlast\nPrevious message repeated 2 times\n', err,
+            )
+
+        out, err = self._run_module('main', '--log-sample=info')
+        self.assertIn('--log-sample', err)
+
     def _mpath(self, name):
         return os.path.join(self.tempdir, name + '.py')
 
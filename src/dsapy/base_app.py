@@ -3,9 +3,21 @@
 
 """Base application framework."""
 
-from typing import Any, Dict, Callable, Generator, Optional, ContextManager, List
+from typing import \
+    Any, Dict, Callable, Generator, AsyncGenerator, Optional, ContextManager, AsyncContextManager, \
+    List, NamedTuple, Sequence, Tuple, Union, cast
 
+import asyncio
+import atexit
+import collections
 import contextlib
+import importlib
+import inspect
+import threading
+import time
+
+from .algs import tasks
+from .algs import topsort
 
 
 class Error(Exception):
@@ -20,21 +32,133 @@ KwArgs = Dict[str, Any]
 KwArgsGenerator = Generator[KwArgs, None, None]
 InitFunc = Callable[..., Optional[KwArgs]]
 FiniFunc = Callable[..., None]
-OnMainFunc = Callable[..., KwArgsGenerator]
-OnMainHandler = Callable[..., ContextManager[KwArgs]]
+KwArgsAsyncGenerator = AsyncGenerator[KwArgs, None]
+OnMainFunc = Callable[..., Union[KwArgsGenerator, KwArgsAsyncGenerator]]
+OnMainHandler = Callable[..., Union[ContextManager[KwArgs], AsyncContextManager[KwArgs]]]
 OnWrapMainFunc = Callable[..., KwArgs]
 MainFunc = Callable[..., Any]
 
 
+class Timing(NamedTuple):
+    '''Wall and CPU time in seconds spent in a handler.'''
+    phase: str
+    name: str
+    wall: float
+    cpu: float
+
+
 class _globals:
     init: List[InitFunc] = []
     fini: List[FiniFunc] = []
     onmain: List[OnMainHandler] = []
     onwrapmain: List[OnWrapMainFunc] = []
     main: List[MainFunc] = []
+    # Handler -> (provides, requires) for handlers that declared dependencies.
+    depends: Dict[Any, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {}
+    timings: List[Timing] = []
+    loaded_wall = time.perf_counter()
+    loaded_cpu = time.process_time()
+    # Exit callbacks of the current daemon request, see `onexit`.
+    exit_stack: Optional[contextlib.ExitStack] = None
+
+
+def _func_name(func: Any) -> str:
+    name = getattr(func, '__qualname__', None)
+    if name is None:
+        return repr(func)
+    return '{}.{}'.format(getattr(func, '__module__', '?'), name)
+
+
+def record_timing(phase: str, name: str, wall: float, cpu: float) -> None:
+    '''Records time spent in a phase since `wall`/`cpu` readings.'''
+    _globals.timings.append(Timing(
+        phase, name, time.perf_counter() - wall, time.process_time() - cpu,
+    ))
+
+
+def _timed(phase: str, name: str, func: Callable[..., Any], /, *args: Any, **kwargs: Any) -> Any:
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        record_timing(phase, name, wall, cpu)
+
 
+class _TimedContext:
+    def __init__(self, name: str, cm: ContextManager[KwArgs]) -> None:
+        self.name = name
+        self.cm = cm
 
-def init(func: InitFunc) -> None:
+    def __enter__(self) -> KwArgs:
+        return _timed('onmain', self.name, self.cm.__enter__)
+
+    def __exit__(self, *exc: Any) -> Any:
+        return _timed('onmain-exit', self.name, self.cm.__exit__, *exc)
+
+
+class _TimedAsyncContext:
+    def __init__(self, name: str, cm: AsyncContextManager[KwArgs]) -> None:
+        self.name = name
+        self.cm = cm
+
+    async def __aenter__(self) -> KwArgs:
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            return await self.cm.__aenter__()
+        finally:
+            record_timing('onmain', self.name, wall, cpu)
+
+    async def __aexit__(self, *exc: Any) -> Any:
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            return await self.cm.__aexit__(*exc)
+        finally:
+            record_timing('onmain-exit', self.name, wall, cpu)
+
+
+def exit_status(e: SystemExit, report: Optional[Callable[[Any], Any]] = None) -> int:
+    '''Returns process exit status for `e` as the interpreter sets it.
+
+    A code that is neither None nor int means status 1; the interpreter
+    prints it to stderr, here it's passed to `report` if given.
+    '''
+    if e.code is None:
+        return 0
+    if isinstance(e.code, int):
+        return e.code
+    if report is not None:
+        report(e.code)
+    return 1
+
+
+def get_timings() -> List[Timing]:
+    '''Returns timings of handlers run so far, in order of completion.
+
+    Phases are "onwrapmain", "imports" (from loading of dsapy to `start`),
+    "init", "onmain", "main", "onmain-exit" and "fini".
+    '''
+    return _globals.timings
+
+
+def init(func: Optional[InitFunc] = None, *, provides: Sequence[str] = (), requires: Sequence[str] = ()) -> Any:
+    '''Declares an initialization handler.
+
+    Use as `@app.init` or, to declare dependencies, as
+    `@app.init(provides=[...], requires=[...])`.  Plain handlers run one
+    after another in registration order, each may return new kwargs.
+    Handlers with dependencies run after them, concurrently in a thread
+    pool as soon as handlers providing their required keys are done (or
+    the keys are already in kwargs); a returned dict is merged into
+    kwargs.  `start(init_jobs=N)` limits the pool size.
+    '''
+    if func is None:
+        def init_wrapper(func: InitFunc) -> None:
+            _globals.depends[func] = (tuple(provides), tuple(requires))
+            _globals.init.append(func)
+        return init_wrapper
     _globals.init.append(func)
 
 
@@ -42,10 +166,90 @@ def fini(func: FiniFunc):
     _globals.fini.append(func)
 
 
-def onmain(func: OnMainFunc):
-    _globals.onmain.append(
-        contextlib.contextmanager(func)
-    )
+def onexit(func: Callable[[], Any]) -> None:
+    '''Registers `func` to run at process exit, after all `fini` handlers.
+
+    In daemon mode it runs at the end of the request instead.
+    '''
+    if _globals.exit_stack is not None:
+        _globals.exit_stack.callback(func)
+    else:
+        atexit.register(func)
+
+
+def onmain(func: Optional[OnMainFunc] = None, *, provides: Sequence[str] = (), requires: Sequence[str] = ()) -> Any:
+    '''Declares a handler wrapping main, a generator yielding kwargs once.
+
+    Async generators are entered with `async with` on the event loop that
+    runs main.  Use as `@app.onmain(provides=[...], requires=[...])` to
+    declare dependencies: handlers are entered in registration order except
+    that providers of a key are entered before handlers requiring it.
+    '''
+    if func is None:
+        def onmain_wrapper(func: OnMainFunc) -> None:
+            onmain(func)
+            _globals.depends[_globals.onmain[-1]] = (tuple(provides), tuple(requires))
+        return onmain_wrapper
+    if inspect.isasyncgenfunction(func):
+        _globals.onmain.append(contextlib.asynccontextmanager(func))
+    else:
+        _globals.onmain.append(contextlib.contextmanager(cast(Any, func)))
+
+
+def _dependency_edges(handlers: Sequence[Any], available: KwArgs) -> List[Tuple[Any, Any]]:
+    providers = collections.defaultdict(list)
+    for h in handlers:
+        for key in _globals.depends.get(h, ((), ()))[0]:
+            providers[key].append(h)
+    edges: List[Tuple[Any, Any]] = []
+    for h in handlers:
+        for key in _globals.depends.get(h, ((), ()))[1]:
+            if key not in providers and key not in available:
+                raise Error('{} requires {!r}, which is not provided'.format(_func_name(h), key))
+            edges.extend((p, h) for p in providers[key])
+    return edges
+
+
+def _ordered_onmain(kwargs: KwArgs) -> List[OnMainHandler]:
+    handlers = _globals.onmain
+    if not any(h in _globals.depends for h in handlers):
+        return handlers
+    position = {h: i for i, h in enumerate(handlers)}
+    return topsort.priority_sort(_dependency_edges(handlers, kwargs), key=position.__getitem__, nodes=handlers)
+
+
+def _run_dependent_inits(handlers: List[InitFunc], kwargs: KwArgs) -> KwArgs:
+    edges = _dependency_edges(handlers, kwargs)
+    # Report cycles before running anything.
+    topsort.topsort(edges)
+
+    lock = threading.Lock()
+    shared = dict(kwargs)
+
+    def run(handler):
+        with lock:
+            snapshot = dict(shared)
+        result = _timed('init', _func_name(handler), handler, **snapshot)
+        if result is not None:
+            with lock:
+                shared.update(result)
+
+    try:
+        tasks.run_tasks(edges, run, nodes=handlers, jobs=kwargs.get('init_jobs'))
+    except tasks.TaskError as e:
+        raise next(iter(e.failed.values())) from e
+    return shared
+
+
+def _is_async_main(main_func: Any) -> bool:
+    # Lazy main is imported by now if it's selected on the command line.
+    if isinstance(main_func, _LazyMain):
+        main_func = main_func.resolve()
+    return inspect.iscoroutinefunction(main_func)
+
+
+def _is_async_handler(handler: OnMainHandler) -> bool:
+    return inspect.isasyncgenfunction(getattr(handler, '__wrapped__', None))
 
 
 def onwrapmain(func: OnWrapMainFunc):
@@ -64,33 +268,170 @@ def main(**kwargs: Any):
         kw = kwargs
         kw['main_func'] = main_func
         for handler in _globals.onwrapmain:
-            kw = handler(**kw)
+            kw = _timed('onwrapmain', _func_name(handler), handler, **kw)
         main_func = kw['main_func']
         _globals.main.append(main_func)
         return main_func
     return main_wrapper
 
 
+class _LazyMain:
+    '''Main function imported from "package.module:attr" on first use.'''
+
+    def __init__(self, target: str) -> None:
+        self.lazy_target = target
+        self.__doc__ = None
+        self._func: Optional[MainFunc] = None
+
+    def resolve(self) -> MainFunc:
+        if self._func is None:
+            module_name, _, attr = self.lazy_target.partition(':')
+            # Commands registered by the module on import are already declared
+            # by this object, don't let them conflict with it.
+            saved = list(_globals.main)
+            try:
+                obj: Any = importlib.import_module(module_name)
+                registered = _globals.main[len(saved):]
+            finally:
+                _globals.main[:] = saved
+            for a in attr.split('.') if attr else []:
+                obj = getattr(obj, a)
+            if isinstance(obj, type):
+                obj = _registered_class_main(obj, registered + saved) or _class_main(obj)
+            self._func = obj
+        return self._func
+
+    def add_arguments(self, argparser: Any) -> None:
+        func = self.resolve()
+        if hasattr(func, 'add_arguments'):
+            func.add_arguments(argparser)
+
+    def __call__(self, **kwargs: Any) -> Any:
+        return self.resolve()(**kwargs)
+
+
+def _registered_class_main(cls: Any, mains: List[MainFunc]) -> Optional[MainFunc]:
+    # `app.Command` classes register their main, fully wrapped by onwrapmain
+    # handlers, when they are defined.
+    for m in mains:
+        if getattr(m, 'command_class', None) is cls:
+            return m
+    return None
+
+
+def _class_main(cls: Any) -> MainFunc:
+    '''Main function running `main` of a command class instance.'''
+    main_func: Any
+    if inspect.iscoroutinefunction(cls.main):
+        async def main_func(**kwargs):
+            return await cls(**kwargs).main()
+    else:
+        def main_func(**kwargs):
+            return cls(**kwargs).main()
+    add_arguments = getattr(cls, 'add_arguments', None)
+    if add_arguments:
+        main_func.add_arguments = add_arguments
+    # Lets `lazy_main` find the registered main of the class.
+    main_func.command_class = cls
+    return main_func
+
+
+def lazy_main(target: str, **kwargs: Any) -> MainFunc:
+    '''Declares a main function without importing it.
+
+    `target` is "package.module:attr".  The module is imported only when the
+    command is selected (its arguments are added to the parser or it's
+    called), so `name`, `help` and `description` must be given here.  `name`
+    defaults to the last component of `attr`.  A class target is treated like
+    `app.Command`: it's instantiated with the main kwargs and its `main()`
+    is called.
+    '''
+    if 'name' not in kwargs:
+        kwargs['name'] = target.rpartition(':')[2].rpartition('.')[2]
+    return main(**kwargs)(_LazyMain(target))
+
+
+def entry_point_mains(group: str) -> None:
+    '''Declares lazy main functions for all entry points in the group.'''
+    from importlib import metadata
+    eps: Any = metadata.entry_points()
+    if hasattr(eps, 'select'):
+        eps = eps.select(group=group)
+    else:
+        eps = eps.get(group, [])
+    for ep in eps:
+        lazy_main(ep.value.split('[', 1)[0].strip(), name=ep.name)
+
+
 def get_commands() -> List[MainFunc]:
     return _globals.main
 
 
 def start(main_func: MainFunc = None, **kwargs: Any) -> None:
+    record_timing('imports', '(before start)', _globals.loaded_wall, _globals.loaded_cpu)
     with contextlib.ExitStack() as estack:
         for fini_f in _globals.fini:
-            estack.callback(fini_f)
+            estack.callback(_timed, 'fini', _func_name(fini_f), fini_f)
 
         if main_func is not None:
             kwargs['main_func'] = main_func
 
         for init_f in _globals.init:
-            new_kwargs = init_f(**kwargs)
+            if init_f in _globals.depends:
+                continue
+            new_kwargs = _timed('init', _func_name(init_f), init_f, **kwargs)
             if new_kwargs is not None:
                 kwargs = new_kwargs
 
-        for w in _globals.onmain:
-            kwargs = estack.enter_context(w(**kwargs))
+        dependent = [f for f in _globals.init if f in _globals.depends]
+        if dependent:
+            kwargs = _run_dependent_inits(dependent, kwargs)
+
+        onmain_handlers = _ordered_onmain(kwargs)
+        if _is_async_main(kwargs.get('main_func')) or any(_is_async_handler(w) for w in onmain_handlers):
+            asyncio.run(_start_async(onmain_handlers, kwargs))
+            return
+
+        for w in onmain_handlers:
+            kwargs = estack.enter_context(_TimedContext(_func_name(w), w(**kwargs)))  # type: ignore
 
         main_func = kwargs.pop('main_func', None)
         if main_func is not None:
-            main_func(**kwargs)
+            wall = time.perf_counter()
+            cpu = time.process_time()
+            try:
+                result = main_func(**kwargs)
+                if inspect.isawaitable(result):
+                    # Sync main returning an awaitable, there is no loop yet.
+                    asyncio.run(_awaited(result))
+            finally:
+                record_timing('main', _func_name(main_func), wall, cpu)
+
+
+async def _start_async(onmain_handlers: List[OnMainHandler], kwargs: KwArgs) -> None:
+    async with contextlib.AsyncExitStack() as astack:
+        for w in onmain_handlers:
+            cm: Any = w(**kwargs)
+            if _is_async_handler(w):
+                kwargs = await astack.enter_async_context(_TimedAsyncContext(_func_name(w), cm))
+            else:
+                kwargs = astack.enter_context(_TimedContext(_func_name(w), cm))
+
+        main_func = kwargs.pop('main_func', None)
+        if main_func is not None:
+            await _timed_await('main', _func_name(main_func), main_func, **kwargs)
+
+
+async def _timed_await(phase: str, name: str, func: Callable[..., Any], /, **kwargs: Any) -> Any:
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        return await _awaited(func(**kwargs))
+    finally:
+        record_timing(phase, name, wall, cpu)
+
+
+async def _awaited(result: Any) -> Any:
+    if inspect.isawaitable(result):
+        return await result
+    return result
@@ -4,7 +4,13 @@
 from typing import Any, List, Callable
 
 import argparse
+import asyncio
+import concurrent.futures
+import inspect
 import logging
+import shlex
+import sys
+import threading
 
 from . import base_app as app
 
@@ -98,13 +104,33 @@ def _init_parse_flags(**kwargs):
 
         - multicommand: if there was only one command registered with
           `app.main`, act as if there is multiple commands.
+
+        - lazy_subcommands: in multicommand mode build the argument parser
+          only for the subcommand selected on the command line.  Other
+          subcommands get bare parsers with name and help only, enough for
+          `--help` and "invalid choice" errors.  On by default if any
+          command is declared with `app.lazy_main`.
+
+        - batch: add `--batch FILE` option.  With it every line of FILE
+          (`-` for stdin) is parsed as a full command line and dispatched
+          to its main function in this process: the parser is built once
+          and `onmain` handlers run once around the whole batch.  Global
+          flags (e.g. logging) are given before `--batch` and the
+          subcommand; they are not accepted on batch lines.
     '''
     kwargs = _normalize_kwargs(kwargs)
+    lazy = kwargs.pop('lazy_subcommands', None)
+    batch = kwargs.pop('batch', False)
     commands, multicommand, kwargs = _detect_mode(**kwargs)
-    if multicommand:
-        flags = _parse_multi_command_args(commands, **kwargs)
+    if lazy is None:
+        lazy = any(hasattr(cmd, 'lazy_target') for cmd in commands)
+    args = sys.argv[1:]
+    if batch and _batch_requested(args, commands, multicommand):
+        flags = _parse_batch_args(commands, multicommand, args, lazy=lazy, **kwargs)
+    elif multicommand:
+        flags = _parse_multi_command_args(commands, lazy=lazy, batch=batch, **kwargs)
     else:
-        flags = _parse_single_command_args(commands[0], **kwargs)
+        flags = _parse_single_command_args(commands[0], batch=batch, **kwargs)
     kwargs['flags'] = flags
     if hasattr(flags, 'main_func'):
         kwargs['main_func'] = flags.main_func
@@ -146,7 +172,17 @@ def _command_name(cmd):
     return getattr(cmd, 'name', None) or getattr(cmd, '__name__', None)
 
 
-def _parse_single_command_args(main_func, **kwargs):
+def _parse_single_command_args(main_func, batch=False, **kwargs):
+    argparser = _single_command_argparser(main_func, kwargs)
+    if batch:
+        _add_batch_arguments(argparser)
+    flags = argparser.parse_args()
+    if not hasattr(flags, 'main_func'):
+        argparser.error('No main function')
+    return flags
+
+
+def _single_command_argparser(main_func, kwargs, global_flags=True):
     parser_kwargs = {}
     parser_kwargs.update(getattr(main_func, 'parser_kwargs', {}))
     parser_kwargs.update(kwargs.get('parser_kwargs', {}))
@@ -156,49 +192,273 @@ def _parse_single_command_args(main_func, **kwargs):
         fromfile_prefix_chars='@',
         **parser_kwargs
     )
-    _populate_single_command_argparser(argparser, main_func)
-    flags = argparser.parse_args()
-    if not hasattr(flags, 'main_func'):
-        argparser.error('No main function')
-    return flags
+    _populate_single_command_argparser(argparser, main_func, global_flags)
+    return argparser
 
 
-def _populate_single_command_argparser(argparser, main_func):
-    for g in _globals.argparsers:
-        g(argparser)
+def _populate_single_command_argparser(argparser, main_func, global_flags=True):
+    if global_flags:
+        for g in _globals.argparsers:
+            g(argparser)
     if hasattr(main_func, 'add_arguments'):
         main_func.add_arguments(argparser)
     argparser.set_defaults(main_func=main_func)
 
 
-def _parse_multi_command_args(commands, **kwargs):
+def _parse_multi_command_args(commands, lazy=False, batch=False, **kwargs):
+    argparser = _multi_command_argparser(kwargs)
+    args = sys.argv[1:]
+    if lazy:
+        _populate_lazy_multi_command_argparser(argparser, commands, kwargs, args)
+    else:
+        _populate_multi_command_argparser(argparser, commands, kwargs)
+    if batch:
+        _add_batch_arguments(argparser)
+    flags = argparser.parse_args(args)
+    if not hasattr(flags, 'main_func'):
+        argparser.error('Subcommand is required')
+    return flags
+
+
+def _multi_command_argparser(kwargs):
     parser_kwargs = getattr(kwargs, 'parser_kwargs', {})
-    argparser = argparse.ArgumentParser(
+    return argparse.ArgumentParser(
         formatter_class=DefaultFormatter,
         fromfile_prefix_chars='@',
         **parser_kwargs
     )
-    _populate_multi_command_argparser(argparser, commands, kwargs)
-    flags = argparser.parse_args()
-    if not hasattr(flags, 'main_func'):
-        argparser.error('Subcommand is required')
-    return flags
 
 
-def _populate_multi_command_argparser(argparser, commands, kwargs):
+def _populate_multi_command_argparser(argparser, commands, kwargs, global_flags=True):
     subparsers = argparser.add_subparsers(title='subcommands')
     for cmd in commands:
-        parser_kwargs = {}
-        parser_kwargs.update(kwargs.get('subparser_kwargs', {}))
-        parser_kwargs.update(getattr(cmd, 'parser_kwargs', {}))
-        parser_kwargs.update(getattr(cmd, 'subparser_kwargs', {}))
-        parser = subparsers.add_parser(
-            name=_command_name(cmd),
-            formatter_class=DefaultFormatter,
-            fromfile_prefix_chars='@',
-            **parser_kwargs,
-        )
-        _populate_single_command_argparser(parser, cmd)
+        parser = _add_command_parser(subparsers, cmd, kwargs)
+        _populate_single_command_argparser(parser, cmd, global_flags)
+
+
+def _populate_lazy_multi_command_argparser(argparser, commands, kwargs, args, global_flags=True):
+    selected = _select_command(commands, args)
+    if selected is _unknown_command:
+        _populate_multi_command_argparser(argparser, commands, kwargs, global_flags)
+        return
+
+    subparsers = argparser.add_subparsers(title='subcommands')
+    if selected is not None:
+        parser = _add_command_parser(subparsers, selected, kwargs)
+        _populate_single_command_argparser(parser, selected, global_flags)
+        return
+
+    for cmd in commands:
+        _add_command_parser(subparsers, cmd, kwargs)
+
+
+# Marks command line that can't be pre-scanned for a subcommand.
+_unknown_command = object()
+
+
+def _select_command(commands, args):
+    '''Finds the subcommand named on the command line without parsing it.
+
+    The top-level parser has no options but `-h`, so the subcommand is the
+    first argument unless it's an option.  Arguments read from files can't
+    be pre-scanned.
+    '''
+    if not args or args[0].startswith('-'):
+        return None
+    if args[0].startswith('@'):
+        return _unknown_command
+    for cmd in commands:
+        if _command_name(cmd) == args[0]:
+            return cmd
+    return None
+
+
+def _add_command_parser(subparsers, cmd, kwargs):
+    parser_kwargs = {}
+    parser_kwargs.update(kwargs.get('subparser_kwargs', {}))
+    parser_kwargs.update(getattr(cmd, 'parser_kwargs', {}))
+    parser_kwargs.update(getattr(cmd, 'subparser_kwargs', {}))
+    return subparsers.add_parser(
+        name=_command_name(cmd),
+        formatter_class=DefaultFormatter,
+        fromfile_prefix_chars='@',
+        **parser_kwargs,
+    )
+
+
+def _add_batch_arguments(argparser):
+    group = argparser.add_argument_group('Batch')
+    group.add_argument(
+        '--batch',
+        default=None,
+        metavar='FILE',
+        help='Run every line of FILE ("-" for stdin) as a separate command line',
+    )
+    group.add_argument(
+        '--batch-jobs',
+        type=int,
+        default=1,
+        metavar='N',
+        help='Run up to N batch lines concurrently in threads',
+    )
+    group.add_argument(
+        '--batch-status',
+        default=None,
+        metavar='FILE',
+        help='Write "LINE<TAB>STATUS" for every batch line to FILE',
+    )
+
+
+def _batch_requested(args, commands, multicommand):
+    # Only global arguments count, the subcommand may have its own --batch.
+    names = {_command_name(cmd) for cmd in commands} if multicommand else set()
+    for a in args:
+        if a in names or a == '--':
+            return False
+        if a == '--batch' or a.startswith('--batch='):
+            return True
+    return False
+
+
+def _parse_batch_args(commands, multicommand, args, lazy=False, **kwargs):
+    '''Parses global flags given with `--batch`, prepares per-line parser.'''
+    argparser = argparse.ArgumentParser(
+        formatter_class=DefaultFormatter,
+        fromfile_prefix_chars='@',
+        **kwargs.get('parser_kwargs', {})
+    )
+    for g in _globals.argparsers:
+        g(argparser)
+    _add_batch_arguments(argparser)
+    flags = argparser.parse_args(args)
+
+    line_parser = _line_parser(commands, multicommand, lazy, kwargs)
+    run_async = (
+        any(inspect.iscoroutinefunction(cmd) for cmd in commands)
+        or any(app._is_async_handler(h) for h in app._globals.onmain)
+    )
+    flags.main_func = _batch_main(line_parser, flags, run_async=run_async)
+    return flags
+
+
+def _line_parser(commands, multicommand, lazy, kwargs):
+    '''Returns function giving the parser for arguments of a batch line.
+
+    Line parsers have no global flags, lines get their values from the
+    batch command line.  In lazy mode a parser is built for every selected
+    subcommand on first use.
+    '''
+    if not multicommand:
+        parser = _single_command_argparser(commands[0], kwargs, global_flags=False)
+        return lambda args: parser
+
+    lock = threading.Lock()
+    parsers = {}
+
+    def line_parser(args):
+        selected = _select_command(commands, args) if lazy else _unknown_command
+        with lock:
+            parser = parsers.get(selected)
+            if parser is None:
+                parser = parsers[selected] = _multi_command_argparser(kwargs)
+                if lazy:
+                    _populate_lazy_multi_command_argparser(parser, commands, kwargs, args, global_flags=False)
+                else:
+                    _populate_multi_command_argparser(parser, commands, kwargs, global_flags=False)
+        return parser
+
+    return line_parser
+
+
+def _batch_main(line_parser, batch_flags, run_async=False):
+    # With async mains or onmain handlers the batch runs on the event loop
+    # of `app.start`: line coroutines are awaited there and sync mains of
+    # concurrent lines are run in a thread pool.
+    global_flags = {k: v for k, v in vars(batch_flags).items() if k != 'main_func'}
+
+    def call_line(line, kwargs):
+        args = shlex.split(line)
+        parser = line_parser(args)
+        flags = parser.parse_args(args, namespace=argparse.Namespace(**global_flags))
+        if not hasattr(flags, 'main_func'):
+            parser.error('Subcommand is required')
+        return flags.main_func(**dict(kwargs, flags=flags))
+
+    def run_line(lineno, line, kwargs):
+        try:
+            result = call_line(line, kwargs)
+            if inspect.isawaitable(result):
+                asyncio.run(result)
+        except (SystemExit, Exception) as e:
+            return _line_status(lineno, e)
+        return 0
+
+    async def run_line_async(lineno, line, kwargs, pool):
+        try:
+            if pool is None:
+                result = call_line(line, kwargs)
+            else:
+                result = await asyncio.get_running_loop().run_in_executor(pool, call_line, line, kwargs)
+            if inspect.isawaitable(result):
+                await result
+        except (SystemExit, Exception) as e:
+            return _line_status(lineno, e)
+        return 0
+
+    def batch_main(**kwargs):
+        lines = _batch_lines(batch_flags.batch)
+        if batch_flags.batch_jobs > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=batch_flags.batch_jobs) as pool:
+                statuses = list(pool.map(lambda nl: run_line(nl[0], nl[1], kwargs), lines))
+        else:
+            statuses = [run_line(n, line, kwargs) for n, line in lines]
+        _report_batch(batch_flags, lines, statuses)
+
+    async def async_batch_main(**kwargs):
+        lines = _batch_lines(batch_flags.batch)
+        if batch_flags.batch_jobs > 1:
+            semaphore = asyncio.Semaphore(batch_flags.batch_jobs)
+            with concurrent.futures.ThreadPoolExecutor(max_workers=batch_flags.batch_jobs) as pool:
+                async def run(n, line):
+                    async with semaphore:
+                        return await run_line_async(n, line, kwargs, pool)
+                statuses = await asyncio.gather(*(run(n, line) for n, line in lines))
+        else:
+            statuses = [await run_line_async(n, line, kwargs, None) for n, line in lines]
+        _report_batch(batch_flags, lines, statuses)
+
+    return async_batch_main if run_async else batch_main
+
+
+def _line_status(lineno, e):
+    if isinstance(e, SystemExit):
+        return app.exit_status(e, report=lambda code: _logger.error('%s', code))
+    _logger.error('Batch line %d failed', lineno, exc_info=e)
+    return 1
+
+
+def _batch_lines(path):
+    lines = _read_batch(path)
+    return [(n, line) for n, line in enumerate(lines, 1) if line.strip() and not line.lstrip().startswith('#')]
+
+
+def _report_batch(batch_flags, lines, statuses):
+    failed = [(n, status) for (n, _), status in zip(lines, statuses) if status]
+    for n, status in failed:
+        _logger.error('Batch line %d failed with status %d', n, status)
+    if batch_flags.batch_status is not None:
+        with open(batch_flags.batch_status, 'w') as out:
+            for (n, _), status in zip(lines, statuses):
+                print('{}\t{}'.format(n, status), file=out)
+    if failed:
+        sys.exit(1)
+
+
+def _read_batch(path):
+    if path == '-':
+        return sys.stdin.read().splitlines()
+    with open(path) as f:
+        return f.read().splitlines()
 
 
 class DefaultFormatter(
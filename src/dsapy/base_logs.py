@@ -1,8 +1,10 @@
 #!/usr/bin/python
 # -*- mode: python; coding: utf-8 -*-
 
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Optional
 
+import functools
+import json
 import logging
 import os
 
@@ -48,6 +50,68 @@ Levels: Dict[str, Dict[str, Any]] = {
     },
 }
 
+# Value of `--log-format` that selects `JsonFormatter`.
+JsonFormat = 'json'
+
+# Attributes every record has; other attributes come from `extra`.
+_record_attrs = frozenset(logging.makeLogRecord({}).__dict__) | {'message', 'asctime'}
+
+
+@functools.lru_cache(maxsize=None)
+def _orjson() -> Any:
+    '''Returns `orjson` module or None if it's not installed.
+
+    Imported on first use, tools not logging JSON don't pay for it.
+    '''
+    try:
+        import orjson
+    except ImportError:  # pragma: no cover
+        return None
+    return orjson
+
+
+def _dumps_orjson(obj: Any) -> str:
+    return _orjson().dumps(obj, default=str).decode('utf-8')
+
+
+def _dumps_json(obj: Any) -> str:
+    return json.dumps(obj, default=str, ensure_ascii=False, separators=(',', ':'))
+
+
+class JsonFormatter(logging.Formatter):
+    '''Formats records as JSON objects, one per line.
+
+    Fields are "ts" (seconds since epoch), "level", "logger", "msg", values
+    passed in `extra`, and "exc"/"stack" with formatted traceback and stack
+    if there are any.  `orjson` is used if it's installed.
+    '''
+
+    def __init__(self, dumps: Optional[Callable[[Any], str]] = None) -> None:
+        super().__init__()
+        if dumps is None:
+            dumps = _dumps_orjson if _orjson() is not None else _dumps_json
+        self.dumps = dumps
+
+    def format(self, record: logging.LogRecord) -> str:
+        obj = {
+            'ts': record.created,
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for k, v in record.__dict__.items():
+            if k not in _record_attrs:
+                obj[k] = v
+        if record.exc_info:
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            obj['exc'] = record.exc_text
+        if record.stack_info:
+            obj['stack'] = self.formatStack(record.stack_info)
+        return self.dumps(obj)
+
+
 DefaultLevel = 'normal'
 OverrideEnvLevel = None
 
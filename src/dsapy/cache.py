@@ -0,0 +1,296 @@
+#!/usr/bin/python
+# -*- mode: python; coding: utf-8 -*-
+
+"""On-disk cache of command results.
+
+A command that is a pure function of some of its flags and input files
+can be declared cached: its stdout and output files are stored in a cache
+directory under a key made of the command name, the values of `flags`, and
+fingerprints of the files named by `files` flags.  Next run with the same
+key replays stdout and copies output files back instead of calling main.
+
+    @app.main()
+    @cache.cached(flags=['level'], files=['input'], artifacts=['output'])
+    def build(flags, **kwargs):
+        ...
+
+For `app.Command` set the `cached` class attribute:
+
+    class Build(app.Command):
+        cached = cache.cached(flags=['level'], files=['input'])
+
+Cached commands get `--cache-dir`, `--no-cache` and `--cache-size` flags.
+The least recently used entries are removed when the cache grows over
+`--cache-size`.  Only text written to `sys.stdout` is captured.
+"""
+
+from typing import Any, Callable, Iterable, List, NamedTuple
+
+import contextlib
+import functools
+import hashlib
+import inspect
+import io
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+
+from dsapy import app
+
+_logger = logging.getLogger(__name__)
+
+_fingerprints = ['content', 'mtime']
+_chunk_size = 1 << 20
+
+
+class Error(app.Error):
+    """Base class for errors in the module."""
+
+
+def default_dir() -> str:
+    '''Cache directory: `DSAPY_CACHE_DIR` or "dsapy" in the user cache.'''
+    path = os.environ.get('DSAPY_CACHE_DIR')
+    if path:
+        return path
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'dsapy')
+
+
+def cached(
+        flags: Iterable[str] = (),
+        files: Iterable[str] = (),
+        artifacts: Iterable[str] = (),
+        fingerprint: str = 'content',
+        version: str = '',
+) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    '''Marks main function as cached; apply it before `app.main`.
+
+    Args:
+
+        - flags: names of flags the result depends on.
+
+        - files: names of flags with input file paths (a path or a list of
+          them).  Files are fingerprinted by `fingerprint`: "content" hashes
+          them, "mtime" uses modification time and size.
+
+        - artifacts: names of flags with output file paths, stored in the
+          cache and restored on hit.
+
+        - version: part of the key, change it to invalidate old results.
+    '''
+    if fingerprint not in _fingerprints:
+        raise Error('Unknown fingerprint: {!r}'.format(fingerprint))
+    spec = _Spec(list(flags), list(files), list(artifacts), fingerprint, version)
+
+    def cached_wrapper(main_func):
+        if inspect.iscoroutinefunction(main_func):
+            raise Error('Async main can not be cached: {!r}'.format(main_func))
+        main_func.cache_spec = spec
+        return main_func
+
+    return cached_wrapper
+
+
+class _Spec(NamedTuple):
+    flags: List[str]
+    files: List[str]
+    artifacts: List[str]
+    fingerprint: str
+    version: str
+
+
+@app.onwrapmain
+def _wrap_cached(**kwargs):
+    main_func = kwargs['main_func']
+    spec = getattr(main_func, 'cache_spec', None)
+    if spec is None:
+        return kwargs
+
+    @functools.wraps(main_func)
+    def cached_main(**kwargs):
+        f = kwargs['flags']
+        if f.no_cache:
+            return main_func(**kwargs)
+        name = getattr(main_func, 'name', None) or main_func.__qualname__
+        key = _key(name, spec, f)
+        cache = _Cache(f.cache_dir, f.cache_size * (1 << 20))
+        if cache.replay(key, _paths(f, spec.artifacts)):
+            return None
+        with _captured_stdout() as out:
+            result = main_func(**kwargs)
+        cache.store(key, out.getvalue(), _paths(f, spec.artifacts))
+        return result
+
+    add_arguments = getattr(main_func, 'add_arguments', None)
+
+    def cached_add_arguments(argparser):
+        if add_arguments is not None:
+            add_arguments(argparser)
+        _add_cache_arguments(argparser)
+
+    cached_main.add_arguments = cached_add_arguments  # type: ignore
+    kwargs['main_func'] = cached_main
+    return kwargs
+
+
+def _add_cache_arguments(argparser):
+    argroup = argparser.add_argument_group('Cache')
+    argroup.add_argument(
+        '--cache-dir',
+        default=default_dir(),
+        metavar='DIR',
+        help='Directory of cached results',
+    )
+    argroup.add_argument(
+        '--no-cache',
+        action='store_true',
+        help='Run the command without looking up or storing cached results',
+    )
+    argroup.add_argument(
+        '--cache-size',
+        type=int,
+        default=1024,
+        metavar='MB',
+        help='Maximum size of the cache directory',
+    )
+
+
+def _paths(flags, names):
+    paths: List[str] = []
+    for n in names:
+        value = getattr(flags, n)
+        if value is None:
+            continue
+        if isinstance(value, (str, os.PathLike)):
+            paths.append(os.fspath(value))
+        else:
+            paths.extend(os.fspath(v) for v in value)
+    return paths
+
+
+def _key(name, spec, flags):
+    h = hashlib.sha256()
+    h.update(json.dumps([name, spec.version, spec.fingerprint]).encode('utf-8'))
+    for n in spec.flags:
+        h.update(json.dumps([n, repr(getattr(flags, n))]).encode('utf-8'))
+    for path in _paths(flags, spec.files):
+        h.update(json.dumps(['file', path]).encode('utf-8'))
+        _update_fingerprint(h, path, spec.fingerprint)
+    return h.hexdigest()
+
+
+def _update_fingerprint(h, path, fingerprint):
+    try:
+        if fingerprint == 'mtime':
+            st = os.stat(path)
+            h.update('{} {}'.format(st.st_mtime_ns, st.st_size).encode('ascii'))
+            return
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(_chunk_size)
+                if not chunk:
+                    break
+                h.update(chunk)
+    except FileNotFoundError:
+        h.update(b'\0missing')
+
+
+class _Tee(io.TextIOBase):
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffer = io.StringIO()
+
+    def write(self, s):
+        self.buffer.write(s)
+        return self.stream.write(s)
+
+    def flush(self):
+        self.stream.flush()
+
+    def getvalue(self):
+        return self.buffer.getvalue()
+
+
+@contextlib.contextmanager
+def _captured_stdout():
+    tee = _Tee(sys.stdout)
+    with contextlib.redirect_stdout(tee):  # type: ignore
+        yield tee
+
+
+class _Cache:
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+
+    def replay(self, key, artifacts):
+        entry = os.path.join(self.path, key)
+        try:
+            with open(os.path.join(entry, 'meta.json')) as f:
+                meta = json.load(f)
+            if len(meta['artifacts']) != len(artifacts):
+                return False
+            with open(os.path.join(entry, 'stdout'), encoding='utf-8') as f:
+                out = f.read()
+            for i, path in enumerate(artifacts):
+                shutil.copyfile(os.path.join(entry, 'artifact.{}'.format(i)), path)
+            os.utime(entry)
+        except (OSError, ValueError, KeyError):
+            return False
+        sys.stdout.write(out)
+        return True
+
+    def store(self, key, out, artifacts):
+        # Main has already succeeded, a failure to cache its result must not
+        # fail the run.
+        try:
+            self._store(key, out, artifacts)
+            self.evict()
+        except OSError:
+            _logger.warning('Failed to cache result %s', key, exc_info=True)
+
+    def _store(self, key, out, artifacts):
+        os.makedirs(self.path, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix='.tmp-', dir=self.path)
+        try:
+            with open(os.path.join(tmp, 'stdout'), 'w', encoding='utf-8') as f:
+                f.write(out)
+            for i, path in enumerate(artifacts):
+                shutil.copyfile(path, os.path.join(tmp, 'artifact.{}'.format(i)))
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump({'argv': sys.argv, 'artifacts': artifacts}, f)
+            entry = os.path.join(self.path, key)
+            shutil.rmtree(entry, ignore_errors=True)
+            try:
+                os.rename(tmp, entry)
+            except OSError:
+                # A concurrent run stored the same key first.
+                if not os.path.isdir(entry):
+                    raise
+                shutil.rmtree(tmp, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+    def evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.path):
+            if name.startswith('.'):
+                continue
+            entry = os.path.join(self.path, name)
+            try:
+                size = sum(e.stat().st_size for e in os.scandir(entry))
+                entries.append((os.stat(entry).st_mtime, size, entry))
+            except OSError:
+                continue
+            total += size
+        entries.sort()
+        for _, size, entry in entries:
+            if total <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
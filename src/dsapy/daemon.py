@@ -0,0 +1,229 @@
+#!/usr/bin/python
+# -*- mode: python; coding: utf-8 -*-
+
+"""Warm server mode: serve command-line invocations over a Unix socket.
+
+A long-lived server imports the tool once, so commands are registered and
+heavy modules are loaded before any request comes.  For every request it
+forks a child that takes over the client's stdin, stdout and stderr
+(passed over the socket as file descriptors, so output is streamed as it's
+written), argv, environment and working directory, runs `app.start` and
+reports the exit status back.  Forking keeps requests isolated from each
+other and from the server.
+
+Use `run` instead of `app.start` in the tool:
+
+    if __name__ == '__main__':
+        daemon.run()
+
+and start the server with `DSAPY_SERVE=/path/to/socket tool`.  The client
+is `python -m dsapy.daemon /path/to/socket [ARGS...]`; it doesn't import the
+tool or dsapy.app.  The socket is created accessible to the server's user
+only, and connections from other users are rejected.
+"""
+
+import array
+import contextlib
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+
+_header = struct.Struct('!Q')
+_status = struct.Struct('!i')
+_peercred = struct.Struct('3i')
+_n_fds = 3
+
+# Exit status reported by the client when the server dies without an answer.
+LOST_STATUS = 255
+
+
+def run(**kwargs):
+    '''Serves on `DSAPY_SERVE` socket if it's set, otherwise runs `app.start`.'''
+    path = os.environ.get('DSAPY_SERVE')
+    if path:
+        serve(path, **kwargs)
+    else:
+        from dsapy import app
+        app.start(**kwargs)
+
+
+def serve(path, **kwargs):
+    '''Serves requests on a Unix socket at `path` until interrupted.
+
+    `kwargs` are passed to `app.start` for every request.
+    '''
+    from dsapy import app  # noqa: F401; make sure handlers are registered
+
+    if os.path.exists(path):
+        os.unlink(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Requests run arbitrary commands as the server user, so only the same
+    # user may connect.
+    old_umask = os.umask(0o177)
+    try:
+        sock.bind(path)
+    finally:
+        os.umask(old_umask)
+    sock.listen(128)
+    # Children are never waited for; let the kernel reap them.
+    old_sigchld = signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+    try:
+        while True:
+            conn, _ = sock.accept()
+            if not _same_user(conn):
+                conn.close()
+                continue
+            sys.stdout.flush()
+            sys.stderr.flush()
+            pid = os.fork()
+            if pid == 0:
+                signal.signal(signal.SIGCHLD, old_sigchld)
+                sock.close()
+                _serve_request(conn, kwargs)
+            conn.close()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGCHLD, old_sigchld)
+        sock.close()
+        os.unlink(path)
+
+
+def _same_user(conn):
+    if not hasattr(socket, 'SO_PEERCRED'):
+        # Only the socket file mode protects the server.
+        return True
+    creds = conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, _peercred.size)
+    _, uid, _ = _peercred.unpack(creds)
+    if uid != os.getuid():
+        print('Rejected request from uid {}'.format(uid), file=sys.stderr)
+        return False
+    return True
+
+
+def _serve_request(conn, kwargs):
+    # Runs in a forked child and never returns.  `os._exit` skips atexit
+    # callbacks, those registered with `app.onexit` for the request (e.g.
+    # the startup profile report) are run on the request's exit stack.
+    status = 1
+    try:
+        with contextlib.ExitStack() as exit_stack:
+            request = _recv_request(conn)
+            _take_over(request)
+            status = _start(kwargs, exit_stack)
+    except BaseException:
+        import traceback
+        traceback.print_exc()
+    finally:
+        if 'logging' in sys.modules:
+            sys.modules['logging'].shutdown()
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except Exception:
+                pass
+        try:
+            conn.sendall(_status.pack(status))
+        except OSError:
+            pass
+        os._exit(0)
+
+
+def _take_over(request):
+    for target, fd in enumerate(request['fds']):
+        os.dup2(fd, target)
+        os.close(fd)
+    sys.stdin = open(0, 'r', closefd=False)
+    sys.stdout = open(1, 'w', closefd=False, buffering=1 if os.isatty(1) else -1)
+    sys.stderr = open(2, 'w', closefd=False, buffering=1)
+
+    os.environ.clear()
+    os.environ.update(request['env'])
+    os.chdir(request['cwd'])
+    sys.argv = [request['prog'] or sys.argv[0]] + request['argv']
+
+
+def _start(kwargs, exit_stack):
+    import time
+    from dsapy import app
+    from dsapy import base_app
+
+    base_app._globals.exit_stack = exit_stack
+    # Startup profile of a request starts at the fork.
+    base_app._globals.timings = []
+    base_app._globals.loaded_wall = time.perf_counter()
+    base_app._globals.loaded_cpu = time.process_time()
+    try:
+        app.start(**kwargs)
+    except SystemExit as e:
+        return base_app.exit_status(e, report=lambda code: print(code, file=sys.stderr))
+    return 0
+
+
+def _recv_exactly(conn, size):
+    chunks = []
+    while size:
+        chunk = conn.recv(size)
+        if not chunk:
+            raise EOFError('Connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return b''.join(chunks)
+
+
+def _recv_request(conn):
+    fds = array.array('i')
+    data, ancdata, _, _ = conn.recvmsg(_header.size, socket.CMSG_SPACE(_n_fds * fds.itemsize))
+    for level, kind, cdata in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(cdata[:len(cdata) - (len(cdata) % fds.itemsize)])
+    if not data:
+        raise EOFError('Connection closed')
+    data += _recv_exactly(conn, _header.size - len(data))
+    (size,) = _header.unpack(data)
+    request = json.loads(_recv_exactly(conn, size).decode('utf-8'))
+    request['fds'] = list(fds)
+    return request
+
+
+def call(path, argv=None, env=None, cwd=None, prog=None):
+    '''Runs the command in the server at `path`; returns the exit status.
+
+    The current process's stdin, stdout and stderr are used by the command
+    directly.  Defaults are taken from the current process; `prog` defaults
+    to the server's program name.
+    '''
+    request = json.dumps({
+        'argv': list(sys.argv[1:] if argv is None else argv),
+        'env': dict(os.environ if env is None else env),
+        'cwd': os.getcwd() if cwd is None else cwd,
+        'prog': prog,
+    }).encode('utf-8')
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        fds = array.array('i', range(_n_fds))
+        sock.sendmsg(
+            [_header.pack(len(request))],
+            [(socket.SOL_SOCKET, socket.SCM_RIGHTS, fds.tobytes())],
+        )
+        sock.sendall(request)
+        try:
+            (status,) = _status.unpack(_recv_exactly(sock, _status.size))
+        except EOFError:
+            return LOST_STATUS
+    return status
+
+
+def main():
+    if len(sys.argv) < 2:
+        print('Usage: python -m dsapy.daemon SOCKET [ARGS...]', file=sys.stderr)
+        sys.exit(2)
+    sys.exit(call(sys.argv[1], sys.argv[2:]))
+
+
+if __name__ == '__main__':
+    main()
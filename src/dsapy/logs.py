@@ -1,13 +1,39 @@
 #!/usr/bin/python
 # -*- mode: python; coding: utf-8 -*-
 
+from typing import Any, List
+
+import collections
+import copy
+import itertools
 import logging
+import logging.handlers
+import os
+import queue
+import signal
+import sys
+import threading
+import time
 
 from logging import debug, info, warning, error, fatal  # noqa: F401
 
 from dsapy import app
 from dsapy import flag
 from dsapy import base_logs
+from dsapy.algs import strconv
+
+
+class Error(app.Error):
+    """Base class for errors in the module."""
+
+
+class _globals:
+    listener: Any = None
+    queue_handler: Any = None
+    flusher: Any = None
+    ring: Any = None
+    dumper: Any = None
+    dedup: List[Any] = []
 
 
 def _level_key(lvl):
@@ -36,7 +62,7 @@ def _flags(argroup):
         '--log-format',
         default=None,
         metavar='FORMAT',
-        help='Log record format',
+        help='Log record format, "{}" for JSON lines'.format(base_logs.JsonFormat),
     )
     argroup.add_argument(
         '--log-datefmt',
@@ -44,6 +70,98 @@ def _flags(argroup):
         metavar='DATEFMT',
         help='Datetime format for logging',
     )
+    argroup.add_argument(
+        '--log-file',
+        default=None,
+        metavar='FILE',
+        help='Write log to FILE instead of stderr',
+    )
+    argroup.add_argument(
+        '--log-rotate-size',
+        type=int,
+        default=0,
+        metavar='BYTES',
+        help='Rotate log file when it grows over BYTES',
+    )
+    argroup.add_argument(
+        '--log-rotate-when',
+        default=None,
+        metavar='WHEN',
+        help='Rotate log file by time: S, M, H, D, midnight or W0-W6',
+    )
+    argroup.add_argument(
+        '--log-rotate-count',
+        type=int,
+        default=5,
+        metavar='N',
+        help='Number of rotated log files to keep',
+    )
+    argroup.add_argument(
+        '--log-buffer',
+        type=int,
+        default=64 * 1024,
+        metavar='BYTES',
+        help='Size of log file write buffer',
+    )
+    argroup.add_argument(
+        '--log-flush-interval',
+        type=float,
+        default=1.0,
+        metavar='SECONDS',
+        help='Flush log file every SECONDS, and at once for errors; 0 flushes every record',
+    )
+    argroup.add_argument(
+        '--log-rate-limit',
+        type=_rate_limit,
+        default=None,
+        metavar='RATE[/BURST]',
+        help='Write no more than RATE records per second from every logging call, after BURST records',
+    )
+    argroup.add_argument(
+        '--log-sample',
+        type=_sample,
+        action='append',
+        default=[],
+        metavar='LEVEL=N',
+        help='Write one of every N records of LEVEL, e.g. debug=100; may be repeated',
+    )
+    argroup.add_argument(
+        '--log-dedup',
+        action='store_true',
+        help='Write repeated records once, followed by number of repetitions',
+    )
+    argroup.add_argument(
+        '--log-ring',
+        type=int,
+        default=int(os.environ.get('DSAPY_LOG_RING') or 0),
+        metavar='N',
+        help=(
+            'Keep last N records of any level in memory and write them to stderr '
+            'on unhandled exception, on SIGUSR1 or on `logs.dump_ring()`'
+        ),
+    )
+    argroup.add_argument(
+        '--log-async',
+        action='store_true',
+        default=strconv.parse_bool(os.environ.get('DSAPY_LOG_ASYNC')),
+        help='Write log records from a background thread',
+    )
+    argroup.add_argument(
+        '--log-queue-size',
+        type=int,
+        default=10000,
+        metavar='N',
+        help='Maximum number of records waiting to be written in async mode',
+    )
+    argroup.add_argument(
+        '--log-overflow',
+        choices=['block', 'drop', 'count'],
+        default='block',
+        help=(
+            'What to do with a record when async queue is full: wait for space, drop it, '
+            'or drop it and report number of dropped records on exit'
+        ),
+    )
 
 
 @app.onmain
@@ -53,13 +171,454 @@ def _init(**kwargs):
 
     flags = kwargs['flags']
     basic_args = base_logs.Levels[flags.log_level].copy()
-    if flags.log_format is not None:
+    json_format = flags.log_format == base_logs.JsonFormat
+    if flags.log_format is not None and not json_format:
         basic_args['format'] = flags.log_format
     if flags.log_datefmt is not None:
         basic_args['datefmt'] = flags.log_datefmt
+    if flags.log_file is not None:
+        basic_args['handlers'] = [_file_handler(flags)]
     logging.basicConfig(**basic_args)
+    if json_format:
+        for handler in root_logger.handlers:
+            handler.setFormatter(base_logs.JsonFormatter())
+    if flags.log_async:
+        _start_async(flags.log_queue_size, flags.log_overflow)
+    _add_filters(flags)
+    if flags.log_ring > 0:
+        _start_ring(flags.log_ring)
+
+    try:
+        yield kwargs
+    except Exception:
+        dump_ring()
+        raise
+
+
+def _rate_limit(s):
+    rate, _, burst = s.partition('/')
+    return float(rate), float(burst or max(float(rate), 1))
+
+
+def _sample(s):
+    level, sep, n = s.partition('=')
+    levelno = logging.getLevelName(level.upper())
+    if not sep or not isinstance(levelno, int) or int(n) < 1:
+        raise ValueError(s)
+    return levelno, int(n)
+
+
+def _add_filters(flags):
+    # Attached to the handlers of the root logger, i.e. to the queue handler
+    # in async mode, which stays on the root logger when the listener stops
+    # or in a forked child; the ring buffer added later sees all records.
+    for handler in logging.getLogger().handlers:
+        if flags.log_sample:
+            handler.addFilter(SampleFilter(dict(flags.log_sample)))
+        if flags.log_rate_limit is not None:
+            handler.addFilter(RateLimitFilter(*flags.log_rate_limit))
+        if flags.log_dedup:
+            dedup = DedupFilter(handler)
+            handler.addFilter(dedup)
+            _globals.dedup.append(dedup)
+
+
+class SampleFilter(logging.Filter):
+    '''Passes one of every N records of a level; `rates` maps level to N.'''
+
+    def __init__(self, rates):
+        super().__init__()
+        # `next` on itertools.count is atomic, no lock needed.
+        self.counters = {level: (itertools.count(), n) for level, n in rates.items()}
+
+    def filter(self, record):
+        counter = self.counters.get(record.levelno)
+        if counter is None:
+            return True
+        return next(counter[0]) % counter[1] == 0
+
+
+class RateLimitFilter(logging.Filter):
+    '''Token bucket for every logging call site.
+
+    Each site may pass `burst` records at once and `rate` records per second
+    on average.  Buckets are updated without a lock, so under contention the
+    limit is approximate.
+    '''
+
+    def __init__(self, rate, burst):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.buckets = {}
+
+    def filter(self, record):
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [self.burst, now]
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens < 1:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - 1
+        return True
+
+
+class DedupFilter(logging.Filter):
+    '''Suppresses records equal to the previous one.
+
+    Number of suppressed records is written through `handler` before the
+    next different record, or on `flush`.
+    '''
+
+    def __init__(self, handler):
+        super().__init__()
+        self.handler = handler
+        self.lock = threading.Lock()
+        self.last = None
+        self.last_record = None
+        self.repeated = 0
+
+    def filter(self, record):
+        if getattr(record, 'dedup_summary', False):
+            return True
+        key = (record.name, record.levelno, record.pathname, record.lineno, record.msg, record.args)
+        with self.lock:
+            if key == self.last:
+                self.repeated += 1
+                return False
+            summary = self._take_summary()
+            self.last = key
+            self.last_record = record
+        if summary is not None:
+            self.handler.handle(summary)
+        return True
+
+    def flush(self):
+        with self.lock:
+            summary = self._take_summary()
+            self.last = None
+            self.last_record = None
+        if summary is not None:
+            self.handler.handle(summary)
+
+    def _take_summary(self):
+        if not self.repeated:
+            return None
+        last = self.last_record
+        summary = logging.makeLogRecord({
+            'name': last.name,
+            'levelno': last.levelno,
+            'levelname': last.levelname,
+            'pathname': last.pathname,
+            'lineno': last.lineno,
+            'msg': 'Previous message repeated %d times',
+            'args': (self.repeated,),
+            'dedup_summary': True,
+        })
+        self.repeated = 0
+        return summary
+
+
+class RingBufferHandler(logging.Handler):
+    '''Keeps last `capacity` records without formatting them.'''
+
+    def __init__(self, capacity):
+        super().__init__()
+        self.records = collections.deque(maxlen=capacity)
+
+    def handle(self, record):
+        # Appending to deque is atomic, no need for the handler lock.
+        if self.filter(record):
+            self.records.append(record)
+        return True
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def dump(self, stream):
+        records = list(self.records)
+        self.records.clear()
+        fmt = base_logs.Levels['debug']
+        formatter = logging.Formatter(fmt['format'], fmt['datefmt'])
+        stream.write('---- Last {} log records ----\n'.format(len(records)))
+        for record in records:
+            stream.write(formatter.format(record) + '\n')
+        stream.write('---- End of log records ----\n')
+        stream.flush()
+
+
+def _start_ring(capacity):
+    # Records of all levels must reach the ring, other handlers keep the
+    # configured level.
+    root_logger = logging.getLogger()
+    for handler in root_logger.handlers:
+        if handler.level < root_logger.level:
+            handler.setLevel(root_logger.level)
+    root_logger.setLevel(logging.DEBUG)
+    _globals.ring = RingBufferHandler(capacity)
+    root_logger.addHandler(_globals.ring)
+
+    if hasattr(signal, 'SIGUSR1') and threading.current_thread() is threading.main_thread():
+        _globals.dumper = _RingDumper()
+        _globals.dumper.start()
+        signal.signal(signal.SIGUSR1, _request_dump)
+
+
+def _request_dump(signum, frame):
+    # Handler locks may be held by the interrupted code, leave the dump to
+    # the dumper thread.
+    dumper = _globals.dumper
+    if dumper is not None:
+        dumper.pending = True
+        dumper.wakeup.set()
+
+
+class _RingDumper(threading.Thread):
+    def __init__(self):
+        super().__init__(name='dsapy.logs ring dumper', daemon=True)
+        self.wakeup = threading.Event()
+        self.pending = False
+        self.stopped = False
+
+    def run(self):
+        while True:
+            self.wakeup.wait()
+            self.wakeup.clear()
+            if self.pending:
+                self.pending = False
+                dump_ring()
+            if self.stopped:
+                return
+
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
+        self.join()
+
+
+def dump_ring(stream=None):
+    '''Writes records kept with `--log-ring` to `stream` (stderr by default).'''
+    if _globals.ring is None:
+        return
+    queue_handler = _globals.queue_handler
+    if queue_handler is not None:
+        # Let the listener write the records queued so far first.
+        queue_handler.queue.join()
+    _flush_handlers()
+    _globals.ring.dump(sys.stderr if stream is None else stream)
+
+
+class _DeferredFlushMixin:
+    '''Makes file handler flush on `sync` instead of after every record.
+
+    Records at `flush_level` and above are flushed at once.
+    '''
+
+    flush_level = logging.ERROR
+    deferred = True
+    buffer_size = -1
+
+    def _open(self):
+        return open(
+            self.baseFilename, self.mode,
+            buffering=self.buffer_size,
+            encoding=self.encoding,
+            errors=getattr(self, 'errors', None),
+        )
+
+    def flush(self):
+        if not self.deferred:
+            self.sync()
+
+    def sync(self):
+        logging.StreamHandler.flush(self)  # type: ignore
+
+    def emit(self, record):
+        super().emit(record)  # type: ignore
+        if record.levelno >= self.flush_level:
+            self.sync()
+
+
+class _FileHandler(_DeferredFlushMixin, logging.FileHandler):
+    pass
+
+
+class _RotatingFileHandler(_DeferredFlushMixin, logging.handlers.RotatingFileHandler):
+    pass
+
+
+class _TimedRotatingFileHandler(_DeferredFlushMixin, logging.handlers.TimedRotatingFileHandler):
+    pass
+
+
+def _file_handler(flags):
+    if flags.log_rotate_size and flags.log_rotate_when:
+        raise Error('Log file can be rotated either by size or by time')
+
+    handler: Any
+    if flags.log_rotate_when:
+        handler = _TimedRotatingFileHandler(
+            flags.log_file, when=flags.log_rotate_when, backupCount=flags.log_rotate_count, delay=True,
+        )
+    elif flags.log_rotate_size:
+        handler = _RotatingFileHandler(
+            flags.log_file, maxBytes=flags.log_rotate_size, backupCount=flags.log_rotate_count, delay=True,
+        )
+    else:
+        handler = _FileHandler(flags.log_file, delay=True)
+    handler.buffer_size = flags.log_buffer
+    handler.deferred = flags.log_flush_interval > 0
+    if handler.deferred:
+        _globals.flusher = _Flusher(handler, flags.log_flush_interval)
+        _globals.flusher.start()
+    return handler
+
+
+class _Flusher(threading.Thread):
+    def __init__(self, handler, interval):
+        super().__init__(name='dsapy.logs flusher', daemon=True)
+        self.handler = handler
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.handler.sync()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+        self.handler.sync()
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    '''Passes records to the listener thread without formatting them.
+
+    With `direct` set records are passed to the listener's handlers in the
+    calling thread, e.g. when the listener thread is stopped or doesn't
+    exist in a forked child.  The handler stays in place, so its level and
+    filters still apply.
+    '''
+
+    def __init__(self, queue, overflow):
+        super().__init__(queue)
+        self.overflow = overflow
+        self.dropped = 0
+        self.listener = None
+        self.direct = False
+
+    def prepare(self, record):
+        # Arguments may change after the call, take the message now.
+        # Formatting is left to the handlers in the listener thread.
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        if self.direct:
+            self.listener.handle(record)
+            return
+        if self.overflow == 'block':
+            self.queue.put(record)
+            return
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        # Wait for space in a full queue instead of failing.
+        self.queue.put(self._sentinel)
+
+
+def _start_async(queue_size, overflow):
+    root_logger = logging.getLogger()
+    handlers = root_logger.handlers
+    queue_handler = _QueueHandler(queue.Queue(queue_size), overflow)
+    listener = _QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    queue_handler.listener = listener
+    root_logger.handlers = [queue_handler]
+    listener.start()
+    _globals.listener = listener
+    _globals.queue_handler = queue_handler
+
+
+@app.fini
+def _fini():
+    for dedup in _globals.dedup:
+        dedup.flush()
+    _globals.dedup = []
+    dumper = _globals.dumper
+    if dumper is not None:
+        _globals.dumper = None
+        dumper.stop()
+    _stop_async()
+    flusher = _globals.flusher
+    if flusher is not None:
+        _globals.flusher = None
+        flusher.stop()
+
+
+def _stop_async():
+    listener = _globals.listener
+    if listener is None:
+        return
+    queue_handler = _globals.queue_handler
+    _globals.listener = None
+    _globals.queue_handler = None
+    queue_handler.direct = True
+    listener.stop()
+    for handler in listener.handlers:
+        handler.flush()
+    if queue_handler.overflow == 'count' and queue_handler.dropped:
+        logging.getLogger(__name__).warning('Dropped %d log records', queue_handler.dropped)
+
+
+def _after_fork_in_child():
+    # Flusher thread doesn't exist in the child, and children often exit
+    # without flushing (e.g. multiprocessing workers), so flush every record.
+    flusher = _globals.flusher
+    if flusher is not None:
+        _globals.flusher = None
+        flusher.handler.deferred = False
+
+    # Listener thread doesn't exist in the child, write records directly.
+    queue_handler = _globals.queue_handler
+    if queue_handler is not None:
+        _globals.listener = None
+        _globals.queue_handler = None
+        queue_handler.direct = True
+
+    # Nor the ring dumper thread.
+    if _globals.dumper is not None:
+        _globals.dumper = _RingDumper()
+        _globals.dumper.start()
+
+
+def _flush_handlers():
+    # Records buffered before fork would be written by both processes.
+    # Handler locks are reinitialized in the child by logging itself.
+    handlers = []
+    for handler in logging.getLogger().handlers:
+        handlers.append(handler)
+        if isinstance(handler, _QueueHandler):
+            handlers.extend(handler.listener.handlers)
+    for handler in handlers:
+        try:
+            getattr(handler, 'sync', handler.flush)()
+        except Exception:
+            pass
+
 
-    yield kwargs
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=_flush_handlers, after_in_child=_after_fork_in_child)
 
 
 def overrideEnvLevel(level):
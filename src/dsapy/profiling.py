@@ -0,0 +1,146 @@
+#!/usr/bin/python
+# -*- mode: python; coding: utf-8 -*-
+
+"""Startup and handler profiling.
+
+Import the module to get the "Profiling" flags.  `--profile-startup` prints
+wall and CPU time of every init/onmain/main/fini handler on exit.  Module
+import times are recorded as well if `DSAPY_PROFILE_IMPORTS` is set in the
+environment; they are only seen for imports that happen after this module
+is imported, so import it first.  `--profile-main=FILE` saves a cProfile
+capture of the main function for `pstats`.
+"""
+
+from typing import Any, List
+
+import builtins
+import inspect
+import json
+import os
+import sys
+import time
+
+from dsapy import app
+from dsapy import flag
+from dsapy import base_app
+from dsapy.algs import strconv
+
+
+class _globals:
+    flags: Any = None
+
+
+@flag.argroup('Profiling')
+def _flags(argroup):
+    argroup.add_argument(
+        '--profile-startup',
+        action='store_true',
+        default=strconv.parse_bool(os.environ.get('DSAPY_PROFILE_STARTUP')),
+        help='Report time spent in startup phases and handlers on exit',
+    )
+    argroup.add_argument(
+        '--profile-format',
+        choices=['table', 'json'],
+        default='table',
+        help='Format of the startup profile report',
+    )
+    argroup.add_argument(
+        '--profile-output',
+        default=None,
+        metavar='FILE',
+        help='Write the startup profile report to FILE instead of stderr',
+    )
+    argroup.add_argument(
+        '--profile-main',
+        default=None,
+        metavar='FILE',
+        help='Save cProfile stats of the main function to FILE',
+    )
+
+
+@app.onmain
+def _init(**kwargs):
+    flags = kwargs['flags']
+    if flags.profile_startup:
+        _globals.flags = flags
+        app.onexit(_report)
+
+    main_func = kwargs.get('main_func')
+    if flags.profile_main and main_func is not None:
+        kwargs['main_func'] = _profiled(main_func, flags.profile_main)
+
+    yield kwargs
+
+
+def _profiled(main_func, path):
+    import cProfile
+
+    async def profiled_async_main(**kwargs):
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return await main_func(**kwargs)
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+
+    def profiled_sync_main(**kwargs):
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(main_func, **kwargs)
+        finally:
+            profiler.dump_stats(path)
+
+    profiled_main: Any = profiled_async_main if inspect.iscoroutinefunction(main_func) else profiled_sync_main
+    profiled_main.__qualname__ = getattr(main_func, '__qualname__', 'main')
+    profiled_main.__module__ = getattr(main_func, '__module__', __name__)
+    return profiled_main
+
+
+def format_table(timings: List[base_app.Timing]) -> str:
+    name_width = max([len(t.name) for t in timings] + [4])
+    lines = ['{:<12} {:<{w}} {:>10} {:>10}'.format('phase', 'name', 'wall ms', 'cpu ms', w=name_width)]
+    for t in timings:
+        lines.append('{:<12} {:<{w}} {:>10.3f} {:>10.3f}'.format(
+            t.phase, t.name, t.wall * 1000, t.cpu * 1000, w=name_width,
+        ))
+    return '\n'.join(lines) + '\n'
+
+
+def format_json(timings: List[base_app.Timing]) -> str:
+    return json.dumps([t._asdict() for t in timings]) + '\n'
+
+
+def _report():
+    flags = _globals.flags
+    timings = app.get_timings()
+    if flags.profile_format == 'json':
+        text = format_json(timings)
+    else:
+        text = format_table(timings)
+    if flags.profile_output is None:
+        sys.stderr.write(text)
+        sys.stderr.flush()
+    else:
+        with open(flags.profile_output, 'w') as out:
+            out.write(text)
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    n_modules = len(sys.modules)
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        # Only record imports that actually loaded something.
+        if len(sys.modules) != n_modules:
+            label = '.' * level + name
+            if fromlist:
+                label += ' ({})'.format(', '.join(fromlist))
+            base_app.record_timing('import', label, wall, cpu)
+
+
+_original_import = builtins.__import__
+if strconv.parse_bool(os.environ.get('DSAPY_PROFILE_IMPORTS')):
+    builtins.__import__ = _timed_import
@@ -0,0 +1,114 @@
+#!/usr/bin/python
+# -*- mode: python; coding: utf-8 -*-
+
+"""Resource usage of the run.
+
+Import the module to get the "Resource usage" flags.  With `--rusage` (or
+`DSAPY_RUSAGE` set in the environment) a JSON record with peak RSS, CPU
+times, wall time and garbage collector counts is written when main returns
+or fails: to the log, or appended as a line to `--rusage-file`.
+`--rusage-tracemalloc` adds peak of memory allocated by Python, at the cost
+of slower allocations.
+"""
+
+from typing import Any, Dict
+
+import gc
+import json
+import logging
+import os
+import resource
+import sys
+import time
+import tracemalloc
+
+from dsapy import app
+from dsapy import flag
+from dsapy import base_app
+from dsapy.algs import strconv
+
+_logger = logging.getLogger(__name__)
+
+
+@flag.argroup('Resource usage')
+def _flags(argroup):
+    argroup.add_argument(
+        '--rusage',
+        action='store_true',
+        default=strconv.parse_bool(os.environ.get('DSAPY_RUSAGE')),
+        help='Report resource usage on exit',
+    )
+    argroup.add_argument(
+        '--rusage-file',
+        default=None,
+        metavar='FILE',
+        help='Append resource usage record to FILE instead of the log',
+    )
+    argroup.add_argument(
+        '--rusage-tracemalloc',
+        action='store_true',
+        help='Trace Python memory allocations and report their peak',
+    )
+
+
+@app.onmain
+def _init(**kwargs):
+    flags = kwargs['flags']
+    if not flags.rusage:
+        yield kwargs
+        return
+
+    if flags.rusage_tracemalloc:
+        tracemalloc.start()
+
+    status = 0
+    try:
+        yield kwargs
+    except SystemExit as e:
+        status = base_app.exit_status(e)
+        raise
+    except BaseException:
+        status = 1
+        raise
+    finally:
+        record = collect()
+        record['status'] = status
+        _report(flags, record)
+
+
+def collect() -> Dict[str, Any]:
+    '''Returns resource usage of the process so far.'''
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    record = {
+        'argv': sys.argv,
+        'wall': time.perf_counter() - base_app._globals.loaded_wall,
+        'user': usage.ru_utime,
+        'sys': usage.ru_stime,
+        'children_user': children.ru_utime,
+        'children_sys': children.ru_stime,
+        'max_rss': _rss_bytes(usage.ru_maxrss),
+        'children_max_rss': _rss_bytes(children.ru_maxrss),
+        'gc_collections': [s['collections'] for s in gc.get_stats()],
+        'gc_collected': [s['collected'] for s in gc.get_stats()],
+    }
+
+    if tracemalloc.is_tracing():
+        record['tracemalloc_peak'] = tracemalloc.get_traced_memory()[1]
+    return record
+
+
+def _rss_bytes(maxrss):
+    # Linux reports kilobytes, macOS reports bytes.
+    if sys.platform == 'darwin':
+        return maxrss
+    return maxrss * 1024
+
+
+def _report(flags, record):
+    text = json.dumps(record)
+    if flags.rusage_file is None:
+        _logger.info('rusage %s', text)
+    else:
+        with open(flags.rusage_file, 'a') as out:
+            out.write(text + '\n')
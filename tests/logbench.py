@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+# -*- mode: python; coding: utf-8 -*-
+
+"""Throughput of log formatters.
+
+Logs the same records through a handler writing to /dev/null with every
+text format from `base_logs.Levels` and with `base_logs.JsonFormatter`.
+"""
+
+import logging
+import os
+import time
+
+from dsapy import app
+from dsapy import base_logs
+
+
+def _options(parser):
+    parser.add_argument(
+        '-n',
+        type=int,
+        default=100000,
+        help='Number of records per formatter',
+    )
+
+
+def _formatters():
+    yield 'tiny', logging.Formatter(base_logs._default_format_tiny, base_logs._default_datefmt)
+    yield 'short', logging.Formatter(base_logs._default_format_short, base_logs._default_datefmt)
+    yield 'long', logging.Formatter(base_logs._default_format_long, base_logs._default_datefmt)
+    yield 'json', base_logs.JsonFormatter(dumps=base_logs._dumps_json)
+    if base_logs._orjson() is not None:
+        yield 'json (orjson)', base_logs.JsonFormatter(dumps=base_logs._dumps_orjson)
+
+
+def _bench(formatter, n):
+    logger = logging.getLogger('logbench')
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    with open(os.devnull, 'w') as devnull:
+        handler = logging.StreamHandler(devnull)
+        handler.setFormatter(formatter)
+        logger.handlers = [handler]
+        start = time.perf_counter()
+        for i in range(n):
+            logger.info('processed %s items in %.3f s', i, 0.5, extra={'batch': i % 17, 'shard': 'a'})
+        elapsed = time.perf_counter() - start
+    logger.handlers = []
+    return elapsed
+
+
+@app.main(add_arguments=_options)
+def main(flags, **kwargs):
+    """Compares throughput of log formatters."""
+    print('{:<16} {:>12} {:>10}'.format('formatter', 'records/s', 'us/record'))
+    for name, formatter in _formatters():
+        elapsed = _bench(formatter, flags.n)
+        print('{:<16} {:>12.0f} {:>10.2f}'.format(name, flags.n / elapsed, elapsed / flags.n * 1e6))
+
+
+if __name__ == '__main__':
+    app.start()